@@ -0,0 +1,295 @@
+import argparse, asyncio, json, os, platform, random, shutil, socket, statistics, subprocess, sys, tempfile, time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+# python -m benchmarks.auth_load --users 50 --requests 500 --concurrency 32
+# python -m benchmarks.auth_load --compare a1b2c3d
+#
+# Boots LoginMainService in-process with local stand-ins and drives the auth flows through an ASGI client:
+#   DB     - SQLite (aiosqlite) in a temp dir, or DATABASE_URL if set (e.g. a local Postgres)
+#   Redis  - --redis-url, else a throwaway redis-server if one is on PATH, else fakeredis
+#   SMTP   - an aiosmtpd sink on localhost. The email queue workers really deliver to it
+# No HTTP server is involved: numbers are the app's own cost (routing, validation, Argon2, DB, Redis), not uvicorn's.
+# Results go to benchmarks/results/<git sha>.json. --compare prints the change against an earlier run
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+PASSWORD = "bench-password"
+NEW_PASSWORD = "bench-password-2"
+
+def _git_sha() -> str:
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+        return f"{sha}-dirty" if dirty else sha
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _start_redis_server(work_dir: str) -> Optional[tuple[subprocess.Popen, str]]:
+    binary = shutil.which("redis-server")
+    if binary is None:
+        return None
+
+    socket_path = os.path.join(work_dir, "redis.sock")
+    process = subprocess.Popen(
+        [binary, "--port", "0", "--unixsocket", socket_path, "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    for _ in range(50):
+        if os.path.exists(socket_path):
+            return process, socket_path
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("redis-server did not start")
+
+def _start_smtp_sink():
+    from aiosmtpd.controller import Controller
+
+    class _Sink:
+        received = 0
+        async def handle_DATA(self, server, session, envelope):
+            _Sink.received += 1
+            return "250 OK"
+
+    with socket.socket() as probe: # aiosmtpd can't listen on port 0, pick a free port ourselves
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    controller = Controller(_Sink(), hostname="127.0.0.1", port=port)
+    controller.start()
+    return controller, _Sink
+
+def _configure_environment(args: argparse.Namespace, work_dir: str, smtp_port: int, redis_socket: Optional[str]) -> None:
+    # Settings are read when configs.app_settings is imported -> everything has to be in the environment before importing the app.
+    # setdefault: anything already exported (DATABASE_URL of a local Postgres, ARGON2_*) wins
+    defaults = {
+        "JWT_SECRET": "benchmark-secret",
+        "ALGORITHM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+        "REDIS_HOST": "localhost",
+        "REDIS_PORT": "6379",
+        "REDIS_DB": "0",
+        "ALLOWED_ORIGINS": '["*"]',
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(work_dir, 'bench.db')}",
+        "SCHEMA_STARTUP_MODE": "upgrade", # Fresh database per run
+        "YAGMAIL_MY_EMAIL": "bench@example.com",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(smtp_port),
+        "SMTP_SSL": "false",
+        "SMTP_STARTTLS": "false",
+        "SMTP_SKIP_LOGIN": "true",
+        "ERRORLOGGERULTRAPREMIUSBOT_TOKEN": "benchmark",
+        "ERRORLOGGERULTRAPREMIUSBOT_BASE_URL": "http://127.0.0.1:9/bot", # Nothing listens there. Error reports fail fast
+        "ERRORLOGGERULTRAPREMIUSBOT_CHAT_ID": "0",
+        "LOGIN_MAX_ATTEMPTS": "1000000" # The benchmark logs in as the same users over and over
+    }
+    if args.redis_url:
+        from urllib.parse import urlparse
+        url = urlparse(args.redis_url)
+        defaults.update(REDIS_HOST=url.hostname or "localhost", REDIS_PORT=str(url.port or 6379), REDIS_DB=url.path.strip("/") or "0")
+    elif redis_socket:
+        defaults["REDIS_UNIX_SOCKET"] = redis_socket
+    else:
+        defaults["EMAIL_WORKERS"] = "0" # fakeredis returns from XREADGROUP BLOCK at once -> consumers would spin. Emails are queued, not sent
+
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+def _summarize(name: str, latencies: list[float], statuses: list[int], wall_seconds: float) -> dict:
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    cuts = statistics.quantiles(latencies_ms, n=100, method="inclusive") if len(latencies_ms) > 1 else latencies_ms * 99
+    return {
+        "scenario": name,
+        "requests": len(latencies_ms),
+        "errors": sum(1 for code in statuses if code >= 400 and code != 503),
+        "shed": statuses.count(503), # Argon2 pool full -> fast 503 by design. Lower concurrency or add hashing workers
+        "throughput_rps": round(len(latencies_ms) / wall_seconds, 2),
+        "p50_ms": round(cuts[49], 2),
+        "p95_ms": round(cuts[94], 2),
+        "p99_ms": round(cuts[98], 2),
+        "max_ms": round(latencies_ms[-1], 2)
+    }
+
+async def _drive(name: str, calls: list[tuple[str, Callable[[], Awaitable[Any]]]], concurrency: int) -> tuple[dict, dict[str, Any]]:
+    # calls: (username, request). Returns the summary and each user's last response, so later phases only use users that got through
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    statuses: list[int] = []
+    responses: dict[str, Any] = {}
+
+    async def one(username: str, call: Callable[[], Awaitable[Any]]) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await call()
+            latencies.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+            responses[username] = response
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one(username, call) for username, call in calls))
+    result = _summarize(name, latencies, statuses, time.perf_counter() - wall_start)
+    print(f"{name:<22}{result['requests']:>8}{result['errors']:>8}{result['shed']:>8}{result['throughput_rps']:>10.1f}"
+          f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}")
+    return result, responses
+
+def _succeeded(responses: dict[str, Any]) -> list[str]:
+    return [username for username, response in responses.items() if response.status_code == 200]
+
+async def _run_scenarios(args: argparse.Namespace) -> list[dict]:
+    import httpx
+    from main_service import LoginMainService
+    from services.infrastructure.redis import redis_email_code, redis_password_reset_token
+
+    app = LoginMainService().run()
+    run_id = f"{int(time.time()) % 100000}"
+    usernames = [f"b{run_id}u{i}" for i in range(args.users)]
+    emails = {username: f"{username}@bench.example.com" for username in usernames}
+    results = []
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{'scenario':<22}{'reqs':>8}{'errors':>8}{'shed':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+            result, responses = await _drive("signup_request", [
+                (u, lambda u=u: client.post("/signup/request-confirmation", json={"username": u, "password": PASSWORD, "email": emails[u]}))
+                for u in usernames
+            ], args.concurrency)
+            results.append(result)
+
+            codes = {u: await redis_email_code.get_email_confirmation_code(emails[u]) for u in _succeeded(responses)} # Read outside the timed phase
+            result, responses = await _drive("signup_register", [
+                (u, lambda u=u: client.post("/signup/register", json={"code": codes[u], "email": emails[u]}))
+                for u in codes
+            ], args.concurrency)
+            results.append(result)
+
+            registered = _succeeded(responses)
+            if not registered:
+                raise RuntimeError("No account was registered. Nothing to log in with")
+
+            result, responses = await _drive("token", [
+                (u, lambda u=u: client.post("/token", data={"username": u, "password": PASSWORD}))
+                for u in random.choices(registered, k=args.requests)
+            ], args.concurrency)
+            results.append(result)
+
+            access_tokens = {u: responses[u].json()["access_token"] for u in _succeeded(responses)}
+            for u in registered:
+                if u not in access_tokens: # Shed in the token phase. One at a time never saturates the pool
+                    access_tokens[u] = (await client.post("/token", data={"username": u, "password": PASSWORD})).json()["access_token"]
+
+            result, _ = await _drive("protected", [
+                (u, lambda u=u: client.get("/protected", headers={"Authorization": f"Bearer {access_tokens[u]}"}))
+                for u in random.choices(registered, k=args.requests)
+            ], args.concurrency)
+            results.append(result)
+
+            result, responses = await _drive("password_reset_email", [
+                (u, lambda u=u: client.post("/password-reset-email", json={"address": emails[u]}))
+                for u in registered
+            ], args.concurrency)
+            results.append(result)
+
+            reset_tokens = {u: await redis_password_reset_token.get_password_reset_token(u) for u in _succeeded(responses)}
+            result, _ = await _drive("password_reset", [
+                (u, lambda u=u: client.post(
+                    "/password-reset",
+                    json={"new_password": NEW_PASSWORD, "new_password_confirm": NEW_PASSWORD},
+                    headers={"Authorization": f"Bearer {reset_tokens[u]}"}
+                ))
+                for u in reset_tokens
+            ], args.concurrency)
+            results.append(result)
+
+    return results
+
+def _load_results(reference: str) -> dict:
+    path = reference if os.path.exists(reference) else os.path.join(RESULTS_DIR, f"{reference}.json")
+    with open(path) as f:
+        return json.load(f)
+
+def _compare(baseline: dict, current: dict) -> None:
+    print(f"\nAgainst {baseline['git_sha']} ({baseline['timestamp']}):")
+    print(f"{'scenario':<22}{'rps':>16}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}")
+    previous = {result["scenario"]: result for result in baseline["results"]}
+
+    for result in current["results"]:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        cells = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            change = (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            cells.append(f"{result[key]:>8.1f} {change:>+6.1f}%")
+        print(f"{result['scenario']:<22}" + "".join(cells))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load benchmark of the auth flows against local stand-ins")
+    parser.add_argument("--users", type=int, default=20, help="Accounts created through signup. Signup, register and reset phases run once per user")
+    parser.add_argument("--requests", type=int, default=200, help="Requests in the /token and /protected phases")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--redis-url", help="Use this Redis (its DB gets benchmark keys) instead of a throwaway one")
+    parser.add_argument("--app-logs", action="store_true", help="Keep the app's logs. Off by default: they drown the report")
+    parser.add_argument("--compare", help="Git sha or results file of an earlier run")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    baseline = _load_results(args.compare) if args.compare else None # Before saving: a rerun on the same commit overwrites the file
+
+    work_dir = tempfile.mkdtemp(prefix="auth-bench-")
+    smtp_controller, sink = _start_smtp_sink()
+    redis_server = None if args.redis_url else _start_redis_server(work_dir)
+    _configure_environment(args, work_dir, smtp_controller.port, redis_server[1] if redis_server else None)
+
+    redis_backend = args.redis_url or ("redis-server" if redis_server else "fakeredis")
+    if redis_backend == "fakeredis":
+        import fakeredis, main_service
+        from fakeredis.aioredis import FakeConnection
+        from redis.asyncio import ConnectionPool
+        fake_server = fakeredis.FakeServer()
+        main_service.create_redis_pool = lambda: ConnectionPool(connection_class=FakeConnection, server=fake_server)
+
+    import logging
+    if not args.app_logs:
+        logging.getLogger("logger.logger").setLevel(logging.ERROR) # Saturation warnings show up as the shed column
+
+    try:
+        results = asyncio.run(_run_scenarios(args))
+    finally:
+        smtp_controller.stop()
+        if redis_server:
+            redis_server[0].terminate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "git_sha": _git_sha(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "database": os.environ["DATABASE_URL"].split("://")[0],
+            "redis": redis_backend,
+            "argon2": {key: os.environ.get(key) for key in ("ARGON2_TIME_COST", "ARGON2_MEMORY_COST", "ARGON2_PARALLELISM", "ARGON2_POOL_WORKERS")}
+        },
+        "parameters": {"users": args.users, "requests": args.requests, "concurrency": args.concurrency},
+        "emails_delivered": sink.received,
+        "results": results
+    }
+    print(f"\nEmails delivered to the SMTP sink: {sink.received}")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{report['git_sha']}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {path}")
+
+    if baseline is not None:
+        _compare(baseline, report)
+
+    if any(result["errors"] for result in results):
+        sys.exit(1) # A run with failed requests is not a valid baseline
+
+if __name__ == "__main__":
+    main()
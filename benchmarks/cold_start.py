@@ -0,0 +1,119 @@
+import json, os, statistics, subprocess, sys, tempfile, argparse
+from collections import defaultdict
+
+# python -m benchmarks.cold_start --runs 5 --budget-ms 1200
+# Time to 'import app' in a fresh interpreter (python -X importtime), plus a check that importing has no side effects:
+# no threads, no logs/ directory or log handlers, no DB or network connections, none of the modules that are only needed
+# after startup. Exit code 1 if the median import time is over budget or a side effect shows up, so CI can run it as a gate.
+# tests/test_cold_start.py runs the same checks under pytest.
+# Before: ~1.5 s, with alembic (~500 ms), aiohttp (~150 ms) and yagmail loaded, logs/ created and the log listener started
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUDGET_MS = 1200 # Median import time allowed
+
+LAZY_MODULES = ('alembic', 'aiohttp', 'yagmail') # Loaded by 'configs.schema upgrade', the Telegram log thread and the first email send
+
+# Every socket connect is recorded (Redis, Postgres, the Telegram API). socket is imported before app for that, a few ms
+# that don't count towards the import time
+PROBE = f"""
+import json, logging, os, socket, sys, threading
+connections = []
+_connect = socket.socket.connect
+def _record_connect(sock, address):
+    connections.append(str(address))
+    return _connect(sock, address)
+socket.socket.connect = _record_connect
+
+import app
+
+pool = sys.modules["configs.database"].engine.pool
+print(json.dumps({{
+    "threads": [thread.name for thread in threading.enumerate() if thread is not threading.main_thread()],
+    "lazy_modules_loaded": [name for name in {LAZY_MODULES!r} if name in sys.modules],
+    "logs_dir_created": os.path.exists("logs"),
+    "logging_configured": sys.modules["logger.logger"].queue_listener is not None or bool(logging.getLogger().handlers),
+    "db_connections": pool.checkedin() + pool.checkedout() if hasattr(pool, "checkedin") else 0,
+    "connections": connections
+}}))
+"""
+
+def _parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    # 'import time:  self [us] | cumulative | imported package' -> (name, self_us, cumulative_us)
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+def _run_once() -> tuple[list[tuple[str, int, int]], dict]:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT_DIR, os.environ.get("PYTHONPATH")))))
+    with tempfile.TemporaryDirectory() as cwd: # Anything created in the working directory at import is a side effect
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE],
+            cwd=cwd, env=env, capture_output=True, text=True, timeout=120
+        )
+    if result.returncode != 0:
+        raise SystemExit(f"'import app' failed:\n{result.stderr[-2000:]}")
+    return _parse_importtime(result.stderr), json.loads(result.stdout.strip().splitlines()[-1])
+
+def _app_ms(modules: list[tuple[str, int, int]]) -> float:
+    return next(cumulative for name, _, cumulative in modules if name == "app") / 1000
+
+def _by_package(modules: list[tuple[str, int, int]]) -> list[tuple[str, float]]:
+    # Self times summed per top-level package. Cumulative times nest, so they can't be added up
+    totals: defaultdict[str, int] = defaultdict(int)
+    for name, self_us, _ in modules:
+        totals[name.split(".")[0]] += self_us
+    return sorted(((package, us / 1000) for package, us in totals.items()), key=lambda item: item[1], reverse=True)
+
+def measure(runs: int) -> tuple[float, list[tuple[list[tuple[str, int, int]], dict]]]:
+    _run_once() # Warm-up: writes the .pyc files, so runs measure imports and not compilation
+    samples = [_run_once() for _ in range(runs)]
+    return statistics.median(_app_ms(modules) for modules, _ in samples), samples
+
+def side_effect_failures(side_effects: dict) -> list[str]:
+    failures = []
+    if side_effects["threads"]:
+        failures.append(f"threads started at import: {side_effects['threads']}")
+    if side_effects["lazy_modules_loaded"]:
+        failures.append(f"imported at startup instead of on first use: {side_effects['lazy_modules_loaded']}")
+    if side_effects["logs_dir_created"]:
+        failures.append("logs/ created at import. Logging is set up by configure_logging() in the lifespan")
+    if side_effects["logging_configured"]:
+        failures.append("log handlers installed at import. Logging is set up by configure_logging() in the lifespan")
+    if side_effects["db_connections"]:
+        failures.append(f"{side_effects['db_connections']} DB connection(s) opened at import. Connections belong to the lifespan")
+    if side_effects["connections"]:
+        failures.append(f"connected at import to: {side_effects['connections']}")
+    return failures
+
+def run(runs: int, budget_ms: float, top: int) -> int:
+    median_ms, samples = measure(runs)
+    import_ms = [_app_ms(modules) for modules, _ in samples]
+
+    median_modules, _ = min(samples, key=lambda sample: abs(_app_ms(sample[0]) - median_ms))
+    print(f"{'package':<28}{'self ms':>10}")
+    for package, ms in _by_package(median_modules)[:top]:
+        print(f"{package:<28}{ms:>10.1f}")
+
+    print(f"\nimport app: median {median_ms:.0f} ms, min {min(import_ms):.0f} ms, max {max(import_ms):.0f} ms over {runs} runs (budget {budget_ms:.0f} ms)")
+
+    failures = []
+    if median_ms > budget_ms:
+        failures.append(f"import took {median_ms:.0f} ms, budget is {budget_ms:.0f} ms")
+    failures += side_effect_failures(samples[0][1])
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure 'import app' in a fresh interpreter and enforce a cold-start budget")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help="Median import time allowed. -X importtime itself adds ~10-20%%")
+    parser.add_argument('--top', type=int, default=15, help="Packages to list, by self time")
+    args = parser.parse_args()
+    sys.exit(run(args.runs, args.budget_ms, args.top))
@@ -0,0 +1,78 @@
+import logging, os, queue, tempfile, time, argparse
+from logging.handlers import QueueHandler, QueueListener
+
+from logger.formatters import OrjsonFormatter, SamplingFilter
+
+# python -m benchmarks.logging_overhead --iterations 20000
+# Time spent in the calling thread (the event loop, in the app) per request-shaped burst of log calls.
+# 'before' is the old setup: python-json-logger writing to the stream and file handlers directly
+
+LINES_PER_REQUEST = 4 # A login logs about this many INFO lines
+
+class _LocalQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def _make_logger(name: str, handlers: list[logging.Handler]) -> logging.Logger:
+    bench_logger = logging.getLogger(name)
+    bench_logger.setLevel(logging.DEBUG)
+    bench_logger.propagate = False
+    for handler in handlers:
+        bench_logger.addHandler(handler)
+    return bench_logger
+
+def _request(bench_logger: logging.Logger, lazy: bool) -> None:
+    username = "benchuser"
+    for _ in range(LINES_PER_REQUEST):
+        if lazy:
+            bench_logger.info("Login attempt for username: %s", username)
+        else:
+            bench_logger.info(f"Login attempt for username: {username}")
+
+def _time_us(bench_logger: logging.Logger, lazy: bool, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        _request(bench_logger, lazy)
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+def run(iterations: int) -> None:
+    log_dir = tempfile.mkdtemp()
+    devnull = open(os.devnull, 'w')
+    results = {}
+
+    try:
+        from pythonjsonlogger import jsonlogger
+        before_formatter = jsonlogger.JsonFormatter("%(asctime)s %(levelname)s %(module)s %(message)s")
+    except ImportError:
+        before_formatter = None
+        print("Skipping 'before': python-json-logger is not installed")
+
+    if before_formatter is not None:
+        handlers = [logging.StreamHandler(devnull), logging.FileHandler(os.path.join(log_dir, "before.log"))]
+        for handler in handlers:
+            handler.setFormatter(before_formatter)
+        results["direct handlers, json (before)"] = _time_us(_make_logger("bench.before", handlers), False, iterations)
+
+    for name, sample_rate in (("queue + orjson", 1.0), ("queue + orjson, INFO 1/10", 0.1)):
+        handlers = [logging.StreamHandler(devnull), logging.FileHandler(os.path.join(log_dir, f"{sample_rate}.log"))]
+        for handler in handlers:
+            handler.setFormatter(OrjsonFormatter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _LocalQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+        listener = QueueListener(log_queue, *handlers)
+        listener.start()
+
+        results[name] = _time_us(_make_logger(f"bench.{sample_rate}", [queue_handler]), True, iterations)
+        listener.stop() # Drain time isn't counted: it's spent off the caller's thread
+
+    print(f"{'setup':<34}{'us per request':>16}")
+    for name, us in results.items():
+        print(f"{name:<34}{us:>16.2f}")
+    devnull.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark logging cost on the calling thread")
+    parser.add_argument('--iterations', type=int, default=20000)
+    run(parser.parse_args().iterations)
@@ -0,0 +1,79 @@
+import logging, os, time, tracemalloc, argparse
+from logging.handlers import QueueListener
+
+from configs.database import async_session
+
+from logger.logger import logger, log_queue
+from logger.formatters import OrjsonFormatter
+
+from dependencies.services import get_db_service, get_reset_confirm_service, get_auth_service
+from services.infrastructure.db import DbService
+
+# python -m benchmarks.service_graph --iterations 20000
+# Cost of building the services for one signup request, in the calling thread (the event loop, in the app).
+# 'before' is the old graph: AuthService(db) built its own DbService, AuthServiceHelper(db) a second one and
+# ResetConfirmService(self.db_service) a third, each logging "DB service initialized successfully" at INFO
+
+class _LegacyDbService(DbService):
+    def __init__(self, db):
+        super().__init__(db)
+        logger.info("DB service initialized successfully")
+
+def _legacy_graph(session) -> None:
+    db_service = _LegacyDbService(session) # AuthService
+    _LegacyDbService(session) # AuthServiceHelper
+    _LegacyDbService(db_service) # ResetConfirmService(self.db_service)
+    get_auth_service(db_service, get_reset_confirm_service(db_service))
+
+def _graph(session) -> None:
+    db_service = get_db_service(session) # FastAPI resolves it once per request and hands the same one to both
+    get_auth_service(db_service, get_reset_confirm_service(db_service))
+
+def _time_us(build, session, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        build(session)
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+def _allocated_bytes(build, session, iterations: int) -> float:
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for _ in range(iterations):
+        build(session)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (peak - before) / iterations # Log records wait in the queue -> what stays allocated until the listener catches up
+
+def _log_records(build, session) -> int:
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger.addHandler(handler)
+    try:
+        build(session)
+    finally:
+        logger.removeHandler(handler)
+    return len(records)
+
+def run(iterations: int) -> None:
+    devnull_handler = logging.StreamHandler(open(os.devnull, 'w'))
+    devnull_handler.setFormatter(OrjsonFormatter())
+    queue_listener = QueueListener(log_queue, devnull_handler) # Same queue path as the app, without flooding the console and app.log
+    queue_listener.start()
+
+    session = async_session() # Never touches the database: building services doesn't open a connection
+
+    print(f"{'graph':<24}{'us/request':>12}{'bytes/request':>15}{'log records':>13}")
+    for name, build in (("per-call (before)", _legacy_graph), ("request-scoped", _graph)):
+        build(session) # Warm-up
+        time_us = _time_us(build, session, iterations)
+        queue_listener.stop() # Drain, so the next measurement doesn't compete with the listener thread
+        queue_listener.start()
+        allocated = _allocated_bytes(build, session, min(iterations, 2000))
+        print(f"{name:<24}{time_us:>12.2f}{allocated:>15.0f}{_log_records(build, session):>13}")
+    queue_listener.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark building the per-request service graph")
+    parser.add_argument('--iterations', type=int, default=20000)
+    run(parser.parse_args().iterations)
@@ -0,0 +1,51 @@
+import json, time, argparse
+
+from argon2 import PasswordHasher
+
+from schemas.user import CredentialsHashed
+from services.infrastructure.serializers import SignupRecordSerializer
+
+# python -m benchmarks.signup_record_codec --iterations 50000
+# Compares bytes per pending-signup record and encode/decode time. 'json + validation' is how records were stored before
+
+def _legacy_dumps(user_info: CredentialsHashed) -> bytes:
+    return json.dumps(user_info.model_dump()).encode()
+
+def _legacy_loads(user_info_bytes: bytes) -> CredentialsHashed:
+    return CredentialsHashed(**json.loads(user_info_bytes.decode()))
+
+def _time_us(func, arg, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+def run(iterations: int) -> None:
+    user_info = CredentialsHashed(
+        username="benchuser",
+        hashed_password=PasswordHasher().hash("benchmark-password"),
+        email="bench.user@example.com"
+    )
+
+    codecs = {"json + validation (before)": (_legacy_dumps, _legacy_loads)}
+    for record_format in ('json', 'compact', 'msgpack'):
+        try:
+            serializer = SignupRecordSerializer(record_format)
+        except ImportError:
+            print(f"Skipping '{record_format}': msgpack is not installed")
+            continue
+        codecs[record_format] = (serializer.dumps, serializer.loads)
+
+    print(f"{'format':<28}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for name, (dumps, loads) in codecs.items():
+        encoded = dumps(user_info)
+        assert loads(encoded).model_dump() == user_info.model_dump()
+
+        encode_us = _time_us(dumps, user_info, iterations)
+        decode_us = _time_us(loads, encoded, iterations)
+        print(f"{name:<28}{len(encoded):>8}{encode_us:>12.2f}{decode_us:>12.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark pending-signup record encodings")
+    parser.add_argument('--iterations', type=int, default=20000)
+    run(parser.parse_args().iterations)
@@ -0,0 +1,118 @@
+import argparse, asyncio, os, random, shutil, signal, socket, subprocess, sys, tempfile, time
+from typing import Optional
+
+from benchmarks.auth_load import PASSWORD, REPO_ROOT, _configure_environment, _drive, _start_redis_server, _start_smtp_sink
+
+# python -m benchmarks.worker_scaling --max-workers 4 --requests 400 --concurrency 32
+#
+# Login throughput of server.py over real HTTP with 1, 2, ... --max-workers workers. Logins are Argon2-bound, so requests
+# per second should grow with workers up to the core count and flatten past it.
+# Same stand-ins as auth_load: SQLite in a temp dir (or DATABASE_URL), --redis-url or a throwaway redis-server.
+# fakeredis can't be shared by separate worker processes, so one of the two is required
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def _seed_users(users: int, work_dir: str) -> list[str]:
+    # Through the repo's own CLIs: migrations, then a bulk import (hashes with the configured Argon2 parameters)
+    usernames = [f"scale{i}" for i in range(users)]
+    path = os.path.join(work_dir, "users.csv")
+    with open(path, "w") as f:
+        f.write("username,email,password\n")
+        f.writelines(f"{username},{username}@bench.example.com,{PASSWORD}\n" for username in usernames)
+
+    for command in (["-m", "configs.schema", "upgrade"], ["-m", "services.bulk_import", path]):
+        subprocess.run([sys.executable, *command], cwd=work_dir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return usernames
+
+async def _wait_ready(client, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited with {process.returncode}")
+        try:
+            if (await client.get("/.well-known/jwks.json")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server.py did not become ready")
+
+async def _measure(workers: int, usernames: list[str], args: argparse.Namespace, work_dir: str) -> dict:
+    import httpx
+
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, "server.py"), "--workers", str(workers), "--bind", f"127.0.0.1:{port}"],
+        cwd=work_dir, # The workers' logs/ ends up in the temp dir
+        stdout=None if args.app_logs else subprocess.DEVNULL,
+        stderr=None if args.app_logs else subprocess.DEVNULL
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            await _wait_ready(client, process)
+            await _drive(f"warm-up {workers}", [ # Every worker has served logins (Argon2 pools warm) before timing
+                (u, lambda u=u: client.post("/token", data={"username": u, "password": PASSWORD}))
+                for u in random.choices(usernames, k=workers * 4)
+            ], args.concurrency)
+
+            result, _ = await _drive(f"{workers} workers", [
+                (u, lambda u=u: client.post("/token", data={"username": u, "password": PASSWORD}))
+                for u in random.choices(usernames, k=args.requests)
+            ], args.concurrency)
+            return result
+    finally:
+        process.send_signal(signal.SIGTERM) # Graceful: workers finish, master cleans up
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+async def _run(args: argparse.Namespace, usernames: list[str], work_dir: str) -> list[dict]:
+    print(f"{'scenario':<22}{'reqs':>8}{'errors':>8}{'shed':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    return [await _measure(workers, usernames, args, work_dir) for workers in range(1, args.max_workers + 1)]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Login throughput of server.py from 1 to N workers")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="Logins per worker count")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--redis-url", help="Use this Redis (its DB gets benchmark keys) instead of a throwaway one")
+    parser.add_argument("--app-logs", action="store_true")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="scaling-bench-")
+    redis_server: Optional[tuple[subprocess.Popen, str]] = None
+    if not args.redis_url:
+        redis_server = _start_redis_server(work_dir)
+        if redis_server is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise SystemExit("Needs a Redis all workers can reach: redis-server on PATH or --redis-url")
+    smtp_controller, _ = _start_smtp_sink()
+    _configure_environment(args, work_dir, smtp_controller.port, redis_server[1] if redis_server else None)
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, (REPO_ROOT, os.environ.get("PYTHONPATH"))))
+    os.environ["SCHEMA_STARTUP_MODE"] = "verify" # Migrated once by _seed_users
+
+    try:
+        results = asyncio.run(_run(args, _seed_users(args.users, work_dir), work_dir))
+    finally:
+        smtp_controller.stop()
+        if redis_server:
+            redis_server[0].terminate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    base = results[0]["throughput_rps"] or 1
+    print(f"\n{'workers':<10}{'rps':>10}{'speedup':>10}")
+    for workers, result in enumerate(results, start=1):
+        print(f"{workers:<10}{result['throughput_rps']:>10.1f}{result['throughput_rps'] / base:>9.2f}x")
+    print(f"({os.cpu_count()} CPUs. Past the core count, workers only share the same cores)")
+
+    if any(result["errors"] for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,91 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional, Literal
 from datetime import timedelta
 
 class Settings(BaseSettings):
-    JWT_SECRET: str
-    ALGORITHM: str
+    JWT_SECRET: Optional[str] = None # Required for HS* algorithms only
+    ALGORITHM: str # HS256 signs with JWT_SECRET. RS256/ES256 sign with keys from JWT_KEYS_DIR and publish them at /.well-known/jwks.json
+    JWT_KEYS_DIR: Optional[str] = None
+    JWT_ACTIVE_KID: Optional[str] = None # None -> last private key in JWT_KEYS_DIR by name
+    JWKS_MAX_AGE_SECONDS: int = 3600 # How long resource servers may cache the JWKS
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 14
     REDIS_HOST: str 
     REDIS_PORT: int
     REDIS_DB: int
+    REDIS_UNIX_SOCKET: Optional[str] = None # If set, used instead of host and port
+    REDIS_MAX_CONNECTIONS: int = 50 # Per process
+    REDIS_POOL_TIMEOUT: float = 2.0 # seconds a call waits for a free connection when all REDIS_MAX_CONNECTIONS are in use
+    REDIS_TOTAL_CONNECTIONS: Optional[int] = None # Across all workers of server.py. Set -> split per worker, after reserving each worker's background connections
+    REDIS_SOCKET_TIMEOUT: float = 2.0 # seconds
+    REDIS_CONNECT_TIMEOUT: float = 2.0 # seconds
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30 # seconds
     ALLOWED_ORIGINS: List[str]
     DATABASE_URL: str
+    DATABASE_REPLICA_URLS: List[str] = [] # Read replicas. Empty -> everything goes to DATABASE_URL
+    DB_REPLICA_HEALTH_CHECK_SECONDS: float = 5
+    DB_READ_YOUR_WRITES_SECONDS: int = 10 # After a user's own write, their reads stay on the primary this long. Keep above replication lag
+    SCHEMA_STARTUP_MODE: Literal['verify', 'upgrade', 'off'] = 'verify' # 'verify' -> one query, refuses to start if migrations are missing. 'upgrade' applies them on boot: single instance/dev only
+    DB_ECHO: bool = False # Logs every SQL statement. Local debugging only
+    DB_POOL_SIZE: int = 5 # Per process
+    DB_MAX_OVERFLOW: int = 10 # Extra connections above pool size under bursts, closed when returned
+    DB_TOTAL_CONNECTIONS: Optional[int] = None # Across all workers of server.py (pool + overflow). Set -> split per worker, keeping the pool/overflow ratio. Keep under the DB's max_connections
+    DB_POOL_TIMEOUT: float = 30 # seconds
+    DB_POOL_RECYCLE: int = 1800 # seconds
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: Optional[int] = 5000 # Postgres only. None -> no limit
+    DB_QUERY_STATS_ENABLED: bool = True
+    DB_SLOW_QUERY_MS: float = 200 # Statements slower than this are logged
     YAGMAIL_MY_EMAIL: str
+    SMTP_HOST: str = 'smtp.gmail.com'
+    SMTP_PORT: Optional[int] = None # None -> 465 with SSL, 587 without
+    SMTP_SSL: bool = True
+    SMTP_STARTTLS: Optional[bool] = None # None -> STARTTLS only if not SSL
+    SMTP_SKIP_LOGIN: bool = False # For a local SMTP stand-in without auth
+    EMAIL_WORKERS: int = 2 # Queue consumers per process
+    EMAIL_SMTP_CONNECTIONS: int = 2 # Long-lived SMTP connections per process
+    EMAIL_BATCH_SIZE: int = 10 # Jobs sent over one connection per queue read
+    EMAIL_MAX_RETRIES: int = 5
+    EMAIL_RETRY_BASE_SECONDS: float = 2.0 # Backoff: base * 2^attempt
+    EMAIL_COOLDOWN_SECONDS: int = 60 # Per address and kind (confirmation/reset). Repeats inside it send nothing, confirmations resend the pending code after it. 0 -> off
     ERRORLOGGERULTRAPREMIUSBOT_TOKEN: str
     ERRORLOGGERULTRAPREMIUSBOT_BASE_URL: str
     ERRORLOGGERULTRAPREMIUSBOT_CHAT_ID: str
+    LOG_INFO_SAMPLE_RATE: float = 1.0 # Fraction of INFO records kept per call site. 1.0 keeps all
+    METRICS_SAMPLE_INTERVAL_SECONDS: float = 5.0 # How often pool gauges are refreshed
+    SERVER_TIMING_ENABLED: bool = True # Per-stage timings in a response header. Lets clients see e.g. whether Argon2 ran -> disable where that matters
+    PROFILE_SAMPLE_EVERY: int = 0 # Profile 1 of every N requests. 0 -> off. Needs pyinstrument
+    PROFILE_SLOW_MS: float = 500 # Sampled requests faster than this are not written
+    PROFILE_DIR: str = "profiles"
+    ARGON2_POOL_WORKERS: Optional[int] = None # None -> one worker process per CPU core. Under server.py: cores // web workers
+    ARGON2_MAX_PENDING: Optional[int] = None # None -> 4 jobs per worker. Above that, hashing requests get 503
+    ARGON2_TIME_COST: int = 3 # Defaults are argon2-cffi defaults. Tune with 'python -m security.argon2_calibration'
+    ARGON2_MEMORY_COST: int = 65536 # KiB
+    ARGON2_PARALLELISM: int = 4
+    ARGON2_TARGET_VERIFY_MS: int = 250 # Latency budget of a single verify, used by calibration
+    ARGON2_MAX_MEMORY_COST: int = 131072 # KiB. Calibration never goes above this
+    ARGON2_CALIBRATE_ON_STARTUP: bool = False # Under server.py: once in the master, inherited by every worker
+    LOGIN_MAX_ATTEMPTS: int = 5 # Failed logins allowed per username inside the window
+    LOGIN_ATTEMPT_WINDOW_SECONDS: int = 15
+    TOKEN_CACHE_ENABLED: bool = True # Cache verified JWTs until their 'exp', so repeat requests skip signature checks
+    TOKEN_CACHE_MAX_SIZE: int = 10000
+    CREDENTIAL_CACHE_ENABLED: bool = False # Login reads username -> password hash from memory/Redis before the DB. Puts hashes in Redis: only with a Redis as locked down as the DB
+    CREDENTIAL_CACHE_LOCAL_TTL_SECONDS: float = 30 # In-process tier. Also the longest a missed invalidation (Redis pub/sub down) can leave an old hash in use
+    CREDENTIAL_CACHE_LOCAL_MAX_SIZE: int = 10000
+    CREDENTIAL_CACHE_REDIS_TTL_SECONDS: int = 300
+    EXISTENCE_FILTER_ENABLED: bool = True # Bloom filter in Redis. Signups with a username and email it has never seen skip the DB check
+    EXISTENCE_FILTER_CAPACITY: int = 1_000_000 # Users it is sized for. Past that, false positives (-> DB checks) grow
+    EXISTENCE_FILTER_ERROR_RATE: float = 0.001 # False positive rate per value at capacity
+    EXISTENCE_FILTER_REBUILD_SECONDS: int = 3600 # Startups rebuild it from the users table at most this often
+    ADMIN_API_KEY: Optional[str] = None # Sent as X-Admin-Key to /admin endpoints. None -> admin endpoints disabled
+    BULK_IMPORT_BATCH_SIZE: int = 1000 # Rows per INSERT and commit
+    BULK_IMPORT_HASH_CHUNK: int = 32 # Passwords hashed per worker job
+    BULK_IMPORT_HASH_CONCURRENCY: Optional[int] = None # Chunks hashed at once by the endpoint. None -> half the Argon2 workers, logins keep the rest
+    SIGNUP_RECORD_FORMAT: Literal['json', 'compact', 'msgpack'] = 'compact' # 'msgpack' needs msgpack installed
+    WEB_WORKERS: Optional[int] = None # server.py processes. None -> one per CPU core: logins are CPU-bound (Argon2), more workers only queue
+    WEB_BIND: str = "0.0.0.0:8000"
+    WEB_GRACEFUL_TIMEOUT: int = 30 # seconds a worker gets to finish in-flight requests on reload/shutdown
+    WEB_KEEPALIVE_SECONDS: int = 5
     
 
     class Config: # Tells pydantic where to look for env variables
@@ -1,12 +1,127 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import declarative_base
+import asyncio, itertools
+from typing import Optional
+
+from sqlalchemy import Select, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import declarative_base, Session
 from configs.app_settings import settings
 
-engine = create_async_engine(url=settings.DATABASE_URL, echo=True) # 'echo=True' logs SQL queries to console
+from logger.logger import logger
+
+from metrics.query_stats import QueryStatsCollector
+
+def _engine_options(database_url: str) -> dict:
+    url = make_url(database_url)
+    options = {"echo": settings.DB_ECHO} # echo logs every statement synchronously. Only for local debugging, query_stats covers production
+
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options # In-memory SQLite uses a single static connection. Pool options don't apply
+
+    options.update(
+        pool_size=settings.DB_POOL_SIZE, # Per process. Total connections = workers * (pool_size + max_overflow)
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT, # Seconds to wait for a free connection before raising
+        pool_recycle=settings.DB_POOL_RECYCLE, # Replace connections older than this. Proxies and servers drop long-lived ones
+        pool_pre_ping=settings.DB_POOL_PRE_PING # Checks a connection on checkout, so a restarted DB doesn't fail the first requests
+    )
+
+    if settings.DB_STATEMENT_TIMEOUT_MS and url.get_backend_name() == "postgresql": # Server cancels statements running longer than this
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+engine = create_async_engine(url=settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
+replica_engines = [create_async_engine(url=url, **_engine_options(url)) for url in settings.DATABASE_REPLICA_URLS]
+
+query_stats = QueryStatsCollector(slow_query_ms=settings.DB_SLOW_QUERY_MS)
+if settings.DB_QUERY_STATS_ENABLED:
+    for _engine in (engine, *replica_engines):
+        query_stats.attach(_engine.sync_engine) # Cursor events are only available on the sync engine the async one wraps
+
+class ReplicaRouter:
+    # Round-robin over healthy replicas. A replica that fails a query is marked down at once and skipped,
+    # the health loop brings it back once 'SELECT 1' works again. No healthy replica -> reads fall back to the primary
+    HEALTH_CHECK_TIMEOUT = 2 # seconds
+
+    def __init__(self, replicas: list[AsyncEngine], health_check_seconds: float):
+        self.replicas = replicas
+        self.health_check_seconds = health_check_seconds
+        self._healthy = {id(replica): True for replica in replicas}
+        self._next = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    @property
+    def healthy_count(self) -> int:
+        return sum(self._healthy.values())
+
+    def choose(self) -> Optional[AsyncEngine]:
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._next) % len(self.replicas)]
+            if self._healthy[id(replica)]:
+                return replica
+        return None
+
+    def mark_down(self, replica: AsyncEngine) -> None:
+        if self._healthy[id(replica)]:
+            self._healthy[id(replica)] = False
+            logger.warning("Read replica %s marked down", replica.url.render_as_string(hide_password=True))
+
+    async def _check(self, replica: AsyncEngine) -> None:
+        try:
+            async with asyncio.timeout(self.HEALTH_CHECK_TIMEOUT):
+                async with replica.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+        except Exception:
+            self.mark_down(replica)
+            return
+
+        if not self._healthy[id(replica)]:
+            self._healthy[id(replica)] = True
+            logger.info("Read replica %s is back", replica.url.render_as_string(hide_password=True))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+            await asyncio.sleep(self.health_check_seconds)
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.dispose()
+
+replica_router = ReplicaRouter(replica_engines, settings.DB_REPLICA_HEALTH_CHECK_SECONDS)
+
+class RoutingSession(Session):
+    # Everything goes to the primary unless the caller set info["use_replica"] (DbService does it for its pure reads).
+    # Even then only SELECTs outside a flush are routed. The replica used is left in info["replica"], so a failure can mark it down
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.info.get("use_replica") and isinstance(clause, Select) and not self._flushing:
+            replica = replica_router.choose()
+            if replica is not None:
+                self.info["replica"] = replica
+                return replica.sync_engine
+        return super().get_bind(mapper, clause=clause, **kwargs)
 
-async_session = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+async_session = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession, sync_session_class=RoutingSession)
 
 Base = declarative_base()
 
 # if expire_on_commit=True, after commit, when I print(user.username), SQLAlchemy will try to refetch user.username from DB, but the session closes after commit -> error
-# if expire_on_commit=False, SQLAlchemy uses whatever is currently in memory, which may be stale. Only a problem when strong consistency is needed (banking) 
\ No newline at end of file
+# if expire_on_commit=False, SQLAlchemy uses whatever is currently in memory, which may be stale. Only a problem when strong consistency is needed (banking)
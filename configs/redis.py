@@ -0,0 +1,28 @@
+from redis.asyncio import BlockingConnectionPool, ConnectionPool, UnixDomainSocketConnection
+from configs.app_settings import settings
+
+def create_redis_pool() -> ConnectionPool:
+    # One pool for the whole process. Every Redis service borrows connections from it instead of opening its own.
+    # Blocking: at max_connections a caller waits up to REDIS_POOL_TIMEOUT for a free connection. The plain pool raises
+    # 'Too many connections' right away, so a burst above the cap turned into 500s instead of queueing
+    options = dict(
+        db=settings.REDIS_DB,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL # PING idle connections before reuse, so a dropped connection isn't handed out
+    )
+
+    if settings.REDIS_UNIX_SOCKET: # Skips TCP entirely when Redis runs on the same host
+        return BlockingConnectionPool(
+            connection_class=UnixDomainSocketConnection,
+            path=settings.REDIS_UNIX_SOCKET,
+            **options
+        )
+    
+    return BlockingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        **options
+    )
@@ -0,0 +1,100 @@
+import argparse, ast, asyncio, os
+from typing import Literal, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from logger.logger import logger, configure_logging
+
+from configs.database import engine
+
+from schemas.exceptions import SchemaVersionError
+
+# Schema is managed by the migrations in migrations/versions. Workers don't run DDL on boot: every worker of every pod
+# doing create_all (reflection + DDL checks) made rolling restarts slow. They check the recorded revision instead
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALEMBIC_INI = os.path.join(ROOT_DIR, "alembic.ini")
+VERSIONS_DIR = os.path.join(ROOT_DIR, "migrations", "versions")
+
+def _revisions() -> dict[str, Optional[str]]:
+    # revision -> down_revision, read from the migration files with ast. Importing alembic to ask it costs ~500 ms per worker
+    # on every boot, and verifying never needs more than these two strings. Migrations stay linear (one head)
+    revisions = {}
+    for name in sorted(os.listdir(VERSIONS_DIR)):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(VERSIONS_DIR, name)) as f:
+            tree = ast.parse(f.read(), filename=name)
+        values = {
+            node.targets[0].id: ast.literal_eval(node.value)
+            for node in tree.body
+            if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name)
+            and node.targets[0].id in ('revision', 'down_revision')
+        }
+        revisions[values['revision']] = values.get('down_revision')
+    return revisions
+
+def _head(revisions: dict[str, Optional[str]]) -> str:
+    heads = set(revisions) - set(revisions.values())
+    if len(heads) != 1:
+        raise SchemaVersionError(f"Expected one head revision in migrations/versions, found {sorted(heads)}")
+    return heads.pop()
+
+async def current_revision() -> Optional[str]:
+    async with engine.connect() as conn:
+        try:
+            return (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar_one_or_none()
+        except DBAPIError: # No alembic_version table: never migrated
+            return None
+
+async def verify_schema() -> None:
+    # One query. Reading the head revision from migrations/ touches only local files
+    revisions = _revisions()
+    head = _head(revisions)
+    current = await current_revision()
+
+    if current == head:
+        logger.info("Database schema is at revision %s", current)
+        return
+
+    if current is not None and current not in revisions: # Migrated by a newer release (e.g. during a rollback). Migrations keep the previous release working
+        logger.warning("Database schema is at revision %s, newer than this release (%s)", current, head)
+        return
+
+    raise SchemaVersionError(
+        f"Database schema is at revision {current or 'none'}, this release needs {head}. Run 'python -m configs.schema upgrade'"
+    )
+
+def upgrade(revision: str = "head") -> None:
+    # Blocking, and runs its own event loop (migrations/env.py). From async code, call it in an executor
+    from alembic import command
+    from alembic.config import Config
+    command.upgrade(Config(ALEMBIC_INI), revision)
+
+async def prepare_schema(mode: Literal['verify', 'upgrade', 'off']) -> None:
+    if mode == 'off':
+        return
+    if mode == 'upgrade':
+        await asyncio.get_running_loop().run_in_executor(None, upgrade)
+    await verify_schema()
+
+if __name__ == '__main__':
+    # python -m configs.schema upgrade    - apply migrations. Run once per deploy, before starting the new release
+    # python -m configs.schema verify     - exit code 1 if the database is behind this release
+    parser = argparse.ArgumentParser(description="Apply or check database migrations")
+    parser.add_argument('action', choices=('upgrade', 'verify'))
+    parser.add_argument('--revision', default='head', help="Target revision for 'upgrade'")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.action == 'upgrade':
+        upgrade(args.revision)
+        print(f"Database schema upgraded to {args.revision}")
+    else:
+        try:
+            asyncio.run(verify_schema())
+        except SchemaVersionError as e:
+            print(e)
+            raise SystemExit(1)
+        print("Database schema is up to date")
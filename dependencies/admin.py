@@ -0,0 +1,19 @@
+import secrets
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+from configs.app_settings import settings
+
+def require_admin_key(x_admin_key: Optional[str] = Header(default=None)) -> None:
+    if settings.ADMIN_API_KEY is None: # Admin endpoints don't exist unless a key is configured
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not Found"
+        )
+
+    if x_admin_key is None or not secrets.compare_digest(x_admin_key, settings.ADMIN_API_KEY): # Constant time, doesn't leak the key through timing
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid admin key"
+        )
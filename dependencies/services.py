@@ -0,0 +1,28 @@
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from dependencies.db import get_db
+
+from services.auth import AuthService
+from services.bulk_import import BulkImportService
+from services.reset_confirm import ResetConfirmService
+from services.infrastructure.db import DbService
+
+# Request-scoped services. FastAPI caches each dependency for the duration of a request, so however many services
+# ask for get_db_service, they all get the same DbService on the same session. Stateless services (token_service,
+# argon2_engine, the redis_* helpers) stay module-level singletons and are imported directly, not provided here
+
+def get_db_service(db: AsyncSession = Depends(get_db)) -> DbService:
+    return DbService(db)
+
+def get_reset_confirm_service(db_service: DbService = Depends(get_db_service)) -> ResetConfirmService:
+    return ResetConfirmService(db_service)
+
+def get_auth_service(
+    db_service: DbService = Depends(get_db_service),
+    reset_confirm_service: ResetConfirmService = Depends(get_reset_confirm_service)
+) -> AuthService:
+    return AuthService(db_service, reset_confirm_service)
+
+def get_bulk_import_service(db: AsyncSession = Depends(get_db)) -> BulkImportService:
+    return BulkImportService(db) # Works on the session directly: it inserts in bulk, not through DbService
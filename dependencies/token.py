@@ -1,3 +1,4 @@
+import hashlib
 from logger.logger import logger
 
 from fastapi import Depends, HTTPException, status
@@ -6,15 +7,30 @@ from jose import jwt, JWTError, ExpiredSignatureError
 
 from configs.app_settings import settings
 
+from security.jwt_keys import jwt_key_ring
+
+from services.infrastructure.revocation import revocation_filter
+
 from schemas.token import TokenSub, TokenResponse
 
+from utils.ttl_cache import TTLCache
+
+from metrics.metrics import stage_timer
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token') # extracts JWT from authorization header
-def decode_token(
-    token: str = Depends(oauth2_scheme)
-) -> TokenSub:
+
+token_cache = TTLCache(max_size=settings.TOKEN_CACHE_MAX_SIZE) # token digest -> TokenSub. Entries live until the token's 'exp'
+
+def _decode_and_verify(token: str) -> TokenSub:
+    if settings.TOKEN_CACHE_ENABLED:
+        cache_key = hashlib.sha256(token.encode()).digest() # Digest, so raw tokens are not kept in memory and keys have fixed size
+        cached_token_sub = token_cache.get(cache_key)
+        if cached_token_sub is not None:
+            return cached_token_sub
     
     try:
-        payload: dict = jwt.decode(token, settings.JWT_SECRET, settings.ALGORITHM)
+        with stage_timer("jwt", "decode"): # Only on cache misses
+            payload: dict = jwt.decode(token, jwt_key_ring.verification_key(token), jwt_key_ring.algorithm)
         username: str = payload.get('sub')
         if username is None:
             logger.info("JWT decoded successfully but no 'sub' claim found") # log.info because it's not a bug, but expected user behaviour
@@ -22,21 +38,41 @@ def decode_token(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token"
             )
-        return TokenSub(username=username) # takes only positional arguments
+        token_sub = TokenSub(username=username, jti=payload.get('jti'), family=payload.get('fid'))
+
+        expires_at = payload.get('exp')
+        if settings.TOKEN_CACHE_ENABLED and expires_at is not None: # Tokens without 'exp' are never cached
+            token_cache.set(cache_key, token_sub, expires_at)
+
+        return token_sub
     
     except ExpiredSignatureError:
-        logger.info(f"JWT expired during decode attempt")
+        logger.info("JWT expired during decode attempt")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token expired"
         )
     
     except JWTError as e:
-        logger.info(f"Invalid token received for decoding: {str(e)}") # Also info, because users may send copied, expired, malformed tokens. warning floods the logs
+        logger.info("Invalid token received for decoding: %s", e) # Also info, because users may send copied, expired, malformed tokens. warning floods the logs
         raise HTTPException(                                  # Use log.exception only for things that are not planned for
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token"
         )
+
+def decode_token(
+    token: str = Depends(oauth2_scheme)
+) -> TokenSub:
+    
+    token_sub = _decode_and_verify(token)
+
+    if revocation_filter.is_revoked(token_sub.jti, token_sub.family): # Checked after the cache too. A cached token can be revoked later
+        logger.info("Revoked token presented by user '%s'", token_sub.username)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked"
+        )
+    return token_sub
     
 def get_token_from_header(token: str = Depends(oauth2_scheme)) -> TokenResponse:
     return TokenResponse( # Depends raises an error itself if no token
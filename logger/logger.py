@@ -1,34 +1,63 @@
-import logging, os
-from pythonjsonlogger import jsonlogger
-from logger.telegram_log_bot import TelegramHandler, MarkdownFormatter
+import logging, os, atexit, queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from logger.formatters import OrjsonFormatter, SamplingFilter
 from configs.app_settings import settings
 
 LOG_DIR = "logs"
-os.makedirs(LOG_DIR, exist_ok=True)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG) # Sets the minimum severity level of log messages this logger will process. DEBUG is the lowest level
 
-formatter = jsonlogger.JsonFormatter(
-    "[%(asctime)s] %(levelname)s in %(module)s: %(message)s"
-)
+class _LocalQueueHandler(QueueHandler):
+    # Default prepare() formats the message in the calling thread, so it can be pickled. Our queue never leaves the process,
+    # so the record goes as is and all formatting happens in the listener thread
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-console_handler.setFormatter(formatter)
+# Callers only put records on the queue. Formatting, disk and stdout writes happen in the listener thread, off the event loop
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+queue_handler = _LocalQueueHandler(log_queue)
+queue_handler.addFilter(SamplingFilter(settings.LOG_INFO_SAMPLE_RATE))
 
-file_handler = logging.FileHandler(filename=f"{LOG_DIR}/app.log")
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
+if not logger.hasHandlers():
+    logger.addHandler(queue_handler) # Records logged before configure_logging() wait in the queue
 
-telegram_handler = TelegramHandler(
-    bot_token=settings.ERRORLOGGERULTRAPREMIUSBOT_TOKEN,
-    chat_id=settings.ERRORLOGGERULTRAPREMIUSBOT_CHAT_ID
-)
-telegram_handler.setLevel(logging.ERROR)
-telegram_handler.setFormatter(MarkdownFormatter())
+queue_listener: Optional[QueueListener] = None
 
-if not logger.hasHandlers():
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    logger.addHandler(telegram_handler)
\ No newline at end of file
+def configure_logging() -> None:
+    # Importing this module has no side effects: no logs/ directory, no open files, no threads. The lifespan and the CLIs
+    # call this first. A thread started at import wouldn't survive a preloading server forking its workers anyway
+    global queue_listener
+    if queue_listener is not None:
+        return
+
+    from logger.telegram_log_bot import TelegramHandler, MarkdownFormatter
+
+    formatter = OrjsonFormatter()
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.DEBUG)
+    console_handler.setFormatter(formatter)
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    file_handler = logging.FileHandler(filename=f"{LOG_DIR}/app.log")
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(formatter)
+
+    telegram_handler = TelegramHandler(
+        bot_token=settings.ERRORLOGGERULTRAPREMIUSBOT_TOKEN,
+        chat_id=settings.ERRORLOGGERULTRAPREMIUSBOT_CHAT_ID
+    )
+    telegram_handler.setLevel(logging.ERROR)
+    telegram_handler.setFormatter(MarkdownFormatter())
+
+    queue_listener = QueueListener(
+        log_queue,
+        file_handler,
+        console_handler,
+        telegram_handler,
+        respect_handler_level=True # Otherwise every handler gets every record regardless of its level
+    )
+    queue_listener.start()
+    atexit.register(queue_listener.stop) # Drains the queue before exit. Registered after logging's own atexit -> runs before it
@@ -1,43 +1,132 @@
-import logging, aiohttp, asyncio
+import logging, asyncio, threading, time
+from collections import deque, OrderedDict
+from typing import Optional, TYPE_CHECKING
 from configs.app_settings import settings
 
+if TYPE_CHECKING:
+    import aiohttp
+
 class TelegramHandler(logging.Handler):
-    def __init__(self, bot_token: str, chat_id: str):
+    # emit() only appends to a bounded buffer. A background thread with its own event loop and a single aiohttp session
+    # sends the buffer every flush_interval as a few combined messages, so an incident doesn't turn into thousands of requests
+    MAX_MESSAGE_LENGTH = 4096 # Telegram limit per message
+
+    def __init__(
+        self,
+        bot_token: str,
+        chat_id: str,
+        buffer_size: int = 1000,
+        flush_interval: float = 5.0,
+        min_send_interval: float = 3.0 # Telegram allows ~20 messages per minute to a group
+    ):
         super().__init__()
         self.bot_token = bot_token
         self.chat_id = chat_id
         self.base_url = settings.ERRORLOGGERULTRAPREMIUSBOT_BASE_URL
-        self._loop = None
+        self.flush_interval = flush_interval
+        self.min_send_interval = min_send_interval
+
+        self._buffer: deque[tuple[tuple, str]] = deque(maxlen=buffer_size) # Full buffer drops the oldest record
+        self._dropped = 0
+        self._buffer_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_send = 0.0
 
     def emit(self, record) -> None:
-        if self._loop is None:
-            try:
-                self._loop = asyncio.get_running_loop()
-            except RuntimeError:
-                self._loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(self._loop)        
-        
-        # Schedule the async task
-        if self._loop.is_running():
-            # if loop is running, create task
-            asyncio.create_task(self._async_emit(record))
-        else:
-            self._loop.run_until_complete(self._async_emit(record))
-
-    async def _async_emit(self, record) -> None:
-        log_entry = self.format(record)
+        try:
+            dedup_key = (record.levelname, record.module, record.getMessage())
+            log_entry = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._buffer_lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self._dropped += 1
+            self._buffer.append((dedup_key, log_entry))
+
+            if self._thread is None: # Started on first record, so importing the logger doesn't spawn threads
+                self._thread = threading.Thread(target=self._run_thread, name="telegram-log", daemon=True)
+                self._thread.start()
+
+    def _take_batch(self) -> list[str]:
+        with self._buffer_lock:
+            records = list(self._buffer)
+            self._buffer.clear()
+            dropped, self._dropped = self._dropped, 0
+
+        # Identical errors (same level, module and message) are sent once with a counter
+        grouped: OrderedDict[tuple, list] = OrderedDict()
+        for dedup_key, log_entry in records:
+            if dedup_key in grouped:
+                grouped[dedup_key][1] += 1
+            else:
+                grouped[dedup_key] = [log_entry, 1]
+
+        entries = [log_entry if count == 1 else f"{log_entry}\n(repeated {count} times)" for log_entry, count in grouped.values()]
+        if dropped:
+            entries.append(f"{dropped} log records dropped: buffer full")
+        return entries
+
+    def _build_messages(self, entries: list[str]) -> list[str]:
+        messages, current = [], ""
+        for entry in entries:
+            entry = entry[:self.MAX_MESSAGE_LENGTH]
+            if current and len(current) + len(entry) + 2 > self.MAX_MESSAGE_LENGTH:
+                messages.append(current)
+                current = ""
+            current = f"{current}\n\n{entry}" if current else entry
+        if current:
+            messages.append(current)
+        return messages
+
+    async def _send(self, session: 'aiohttp.ClientSession', text: str) -> None:
         url = f"{self.base_url}{self.bot_token}/sendMessage"
         data = {
             "chat_id": self.chat_id,
-            "text": log_entry
+            "text": text
         }
-        try:
-            async with aiohttp.ClientSession() as session:
+
+        for _ in range(3):
+            wait = self.min_send_interval - (time.monotonic() - self._last_send)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            try:
                 async with session.post(url=url, data=data) as response:
+                    self._last_send = time.monotonic()
+                    if response.status == 429: # Rate limited. Telegram says how long to wait
+                        body = await response.json(content_type=None)
+                        await asyncio.sleep(body.get("parameters", {}).get("retry_after", 5))
+                        continue
                     if response.status != 200:
                         print(f"Failed to send Telegram message: {response.status}")
-        except Exception as e:
-            print(f"Telegram handler error: {e}") # No 'raise' - logger shouldn't crash the application
+                    return
+            except Exception as e:
+                print(f"Telegram handler error: {e}") # No 'raise' - logger shouldn't crash the application
+                return
+
+    async def _flush(self, session: 'aiohttp.ClientSession') -> None:
+        for message in self._build_messages(self._take_batch()):
+            await self._send(session, message)
+
+    async def _run(self) -> None:
+        import aiohttp # Only the handler thread needs it. Importing it with the logger added ~150 ms to every cold start
+        async with aiohttp.ClientSession() as session: # One session -> one kept-alive connection for the handler's whole life
+            while not self._stop_event.is_set():
+                self._stop_event.wait(self.flush_interval) # Blocking is fine: this loop belongs to the handler thread only
+                await self._flush(session)
+
+    def _run_thread(self) -> None:
+        asyncio.run(self._run())
+
+    def close(self) -> None:
+        # Called by logging.shutdown() at exit. Sends what's left in the buffer
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        super().close()
 
 class MarkdownFormatter(logging.Formatter):
     def format(self, record) -> str:
@@ -48,4 +137,4 @@ class MarkdownFormatter(logging.Formatter):
             f"*{record.levelname}* in `{record.module}` at `{record.asctime}`:\n"
             f"`{record.getMessage()}`"
         )
-        return msg
\ No newline at end of file
+        return msg
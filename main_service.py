@@ -1,26 +1,79 @@
+import asyncio
 from fastapi import FastAPI
 from contextlib import asynccontextmanager, _AsyncGeneratorContextManager
 
 from configs.cors_config import add_cors_middleware
-from configs.create_tables import create_tables
+from configs.schema import prepare_schema
+from configs.database import query_stats, replica_router
 
-from logger.logger import logger
+from logger.logger import logger, configure_logging
+
+from redis.asyncio import Redis
+
+from configs.app_settings import settings
+from configs.redis import create_redis_pool
+
+from security.password_hashing import argon2_engine
+from security.argon2_calibration import calibrate, apply_to_settings
+from security.jwt_keys import jwt_key_ring
+
+from services.infrastructure.redis import bind_redis_services
+from services.infrastructure.revocation import revocation_filter
+from services.infrastructure.existence_filter import existence_filter
+from services.infrastructure.credential_cache import credential_cache
+from services.infrastructure.email_queue import email_queue_worker
 
 from routers.auth import router as auth_router
 from routers.protected import router as protected_router
 from routers.reset import router as reset_router
+from routers.jwks import router as jwks_router
+from routers.metrics import router as metrics_router
+from routers.admin import router as admin_router
+
+from metrics.middleware import PrometheusMiddleware, RequestTimingMiddleware
+from metrics.profiler import SamplingProfiler
+from metrics.sampler import metrics_sampler
 
 class LoginMainService:
     def _configure_lifespan(self) -> _AsyncGeneratorContextManager[None, None]:
         @asynccontextmanager # FastAPI expects lifespan to be async context manager. A context manager is an object you can use with 'async with' or 'with' that automatically handles setup and cleanup around a block of code.
         async def lifespan(app: FastAPI):
+            configure_logging() # Per worker: threads started before a preloading server forks don't survive the fork
             logger.info("Server starting up...")
-            await create_tables()
+            await prepare_schema(settings.SCHEMA_STARTUP_MODE)
+            replica_router.start()
+            jwt_key_ring.load()
+
+            redis_pool = create_redis_pool()
+            redis_client = Redis(connection_pool=redis_pool)
+            bind_redis_services(redis_client)
+            revocation_filter.start()
+            existence_filter.start()
+            credential_cache.start()
+            await email_queue_worker.start()
+            metrics_sampler.start(redis_pool)
+
+            if settings.ARGON2_CALIBRATE_ON_STARTUP: # Single process only: server.py calibrates once in its master and turns this off for the workers. For fleets, prefer the CLI and ship the result in .env
+                parameters = await asyncio.get_running_loop().run_in_executor(None, calibrate)
+                apply_to_settings(parameters)
+                argon2_engine.configure(parameters.time_cost, parameters.memory_cost, parameters.parallelism)
+
+            argon2_engine.start() # Spawn hashing processes now, so the first login doesn't pay for it
 
             try:
                 yield
             finally:
                 logger.info("Server shutting down...")
+                logger.info("Top queries by total time", extra={"queries": query_stats.snapshot(10)})
+                await metrics_sampler.stop()
+                await argon2_engine.stop()
+                await revocation_filter.stop()
+                await existence_filter.stop()
+                await credential_cache.stop()
+                await email_queue_worker.stop()
+                await redis_client.aclose()
+                await redis_pool.disconnect() # Client doesn't own a pool passed to it -> close the pool explicitly
+                await replica_router.stop()
             
         return lifespan
         
@@ -37,12 +90,24 @@ class LoginMainService:
     def _configure_cors(self) -> None:
         add_cors_middleware(self.app)
 
+    def _configure_metrics(self) -> None:
+        self.app.add_middleware(
+            RequestTimingMiddleware,
+            server_timing=settings.SERVER_TIMING_ENABLED,
+            profiler=SamplingProfiler(settings.PROFILE_SAMPLE_EVERY, settings.PROFILE_SLOW_MS, settings.PROFILE_DIR)
+        )
+        self.app.add_middleware(PrometheusMiddleware) # Added after CORS -> outermost, so preflight requests are counted too
+
     def _configure_routers(self) -> None:
         self.app.include_router(auth_router)
         self.app.include_router(protected_router)
         self.app.include_router(reset_router)
+        self.app.include_router(jwks_router)
+        self.app.include_router(metrics_router)
+        self.app.include_router(admin_router)
 
     def run(self) -> FastAPI:
         self._configure_cors()
+        self._configure_metrics()
         self._configure_routers()
         return self.app
@@ -0,0 +1,122 @@
+import asyncio, functools, os, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+    multiprocess
+)
+
+# Multiprocess mode: set PROMETHEUS_MULTIPROC_DIR to an empty directory before the app starts (prometheus_client reads it at import).
+# Every worker writes its samples there and /metrics of any worker returns the sum. Clear the directory on every deploy.
+# server.py does both, and marks exited workers dead so their live gauges drop out
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# Buckets cover a cache hit (sub-ms) up to a saturated Argon2 pool (seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+http_requests_total = Counter(
+    "http_requests_total",
+    "HTTP requests by route template and status code",
+    ["method", "route", "status"]
+)
+
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS
+)
+
+stage_duration_seconds = Histogram(
+    "stage_duration_seconds",
+    "Latency of one call to a backing stage (argon2, db, redis, jwt, email)",
+    ["stage", "operation"],
+    buckets=LATENCY_BUCKETS
+)
+
+stage_errors_total = Counter(
+    "stage_errors_total",
+    "Calls to a backing stage that raised",
+    ["stage", "operation"]
+)
+
+existence_filter_checks_total = Counter(
+    "existence_filter_checks_total",
+    "Signup existence checks by filter answer. 'absent' skipped the DB, 'maybe' and 'unavailable' went to it",
+    ["result"]
+)
+
+credential_cache_lookups_total = Counter(
+    "credential_cache_lookups_total",
+    "Login credential lookups by where they were answered: local, redis or db",
+    ["source"]
+)
+
+email_sends_avoided_total = Counter(
+    "email_sends_avoided_total",
+    "Confirmation/reset email requests that sent nothing: one went to the same address inside EMAIL_COOLDOWN_SECONDS",
+    ["kind"]
+)
+
+# Gauges are sampled by MetricsSampler. 'livesum' adds the values of live workers and drops dead ones
+argon2_pending_jobs = Gauge("argon2_pending_jobs", "Hash/verify jobs submitted and not finished", multiprocess_mode="livesum")
+argon2_workers = Gauge("argon2_workers", "Argon2 worker processes", multiprocess_mode="livesum")
+redis_pool_connections = Gauge("redis_pool_connections", "Redis pool connections by state", ["state"], multiprocess_mode="livesum")
+db_pool_connections = Gauge("db_pool_connections", "SQLAlchemy pool connections by state", ["state"], multiprocess_mode="livesum")
+db_replicas_healthy = Gauge("db_replicas_healthy", "Read replicas currently receiving reads", multiprocess_mode="livemin")
+smtp_connections = Gauge("smtp_connections", "SMTP connections by state", ["state"], multiprocess_mode="livesum")
+token_cache_stats = Gauge("token_cache", "Verified-JWT cache counters", ["stat"], multiprocess_mode="livesum")
+
+# Seconds spent per stage in the current request. Set by RequestTimingMiddleware, None outside requests (queue workers, startup).
+# Sync dependencies run in the threadpool with a copy of the context, but the copy points to the same dict -> their stages count too
+request_stages: ContextVar[Optional[dict[str, float]]] = ContextVar("request_stages", default=None)
+
+@contextmanager
+def stage_timer(stage: str, operation: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors_total.labels(stage, operation).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration_seconds.labels(stage, operation).observe(elapsed)
+
+        stages = request_stages.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+def timed(stage: str, operation: Optional[str] = None) -> Callable:
+    # @timed("redis") on a method -> stage_duration_seconds{stage="redis", operation="RedisEmailCode.get_email_confirmation_code"}
+    def decorator(func: Callable) -> Callable:
+        name = operation or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage, name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def render_latest() -> tuple[bytes, str]:
+    if MULTIPROCESS:
+        registry = CollectorRegistry() # Fresh registry per scrape, filled from the files of all workers
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
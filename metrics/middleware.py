@@ -0,0 +1,97 @@
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from logger.logger import logger
+
+from metrics.metrics import http_requests_total, http_request_duration_seconds, request_stages
+from metrics.profiler import SamplingProfiler
+
+class PrometheusMiddleware:
+    # Pure ASGI instead of BaseHTTPMiddleware: no extra task and no response body copying per request.
+    # Labels use the route template ('/token'), never the raw path, so label count stays bounded
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500 # If the app raises before sending headers, the server answers 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route") # Set by the router on the shared scope once a route matches
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+
+            http_requests_total.labels(method, route_path, str(status_code)).inc()
+            http_request_duration_seconds.labels(method, route_path).observe(time.perf_counter() - start)
+
+class RequestTimingMiddleware:
+    # Collects time per stage (db, redis, argon2, jwt, email) for each request via request_stages.
+    # Sends it back as a Server-Timing header (shown in browser devtools) and writes it into the request's log line
+    def __init__(self, app: ASGIApp, server_timing: bool, profiler: SamplingProfiler):
+        self.app = app
+        self.server_timing = server_timing
+        self.profiler = profiler
+
+    @staticmethod
+    def _format_server_timing(stages: dict[str, float], total: float) -> str:
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        stages: dict[str, float] = {}
+        context_token = request_stages.set(stages)
+        profiler = self.profiler.start()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", self._format_server_timing(stages, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_stages.reset(context_token)
+            duration_ms = (time.perf_counter() - start) * 1000
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+
+            if profiler is not None:
+                try:
+                    self.profiler.finish(profiler, method, route, duration_ms)
+                except Exception:
+                    logger.exception("Failed to write request profile") # Profiling must never fail the request
+
+            logger.info(
+                "%s %s -> %s in %.1f ms", method, route, status_code, duration_ms,
+                extra={
+                    "route": route,
+                    "status": status_code,
+                    "duration_ms": round(duration_ms, 2),
+                    "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in stages.items()}
+                }
+            )
@@ -0,0 +1,53 @@
+import os, time
+from typing import Any, Optional
+
+from logger.logger import logger
+
+class SamplingProfiler:
+    # Profiles 1 of every N requests with pyinstrument (statistical, async-aware) and keeps only the slow ones.
+    # Output is speedscope JSON: open at https://www.speedscope.app or convert for other flame graph viewers
+    def __init__(self, sample_every: int, slow_ms: float, profile_dir: str):
+        self.sample_every = sample_every
+        self.slow_ms = slow_ms
+        self.profile_dir = profile_dir
+        self._count = 0
+        self._active = False # One profile at a time. Concurrent requests on the same loop would blur each other's stacks
+
+        if sample_every > 0:
+            import pyinstrument # Optional dependency. Imported only if enabled, fails at startup instead of first request
+            from pyinstrument.renderers import SpeedscopeRenderer
+            self._profiler_class = pyinstrument.Profiler
+            self._renderer_class = SpeedscopeRenderer
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_every > 0
+
+    def start(self) -> Optional[Any]:
+        if not self.enabled or self._active:
+            return None
+        self._count += 1 # Event loop thread only -> no lock
+        if self._count % self.sample_every:
+            return None
+
+        self._active = True
+        profiler = self._profiler_class(async_mode="enabled") # Follows the request's task only, time spent awaiting shows as 'await'
+        profiler.start()
+        return profiler
+
+    def finish(self, profiler: Any, method: str, route: str, duration_ms: float) -> Optional[str]:
+        try:
+            profiler.stop()
+        finally:
+            self._active = False
+
+        if duration_ms < self.slow_ms:
+            return None
+
+        route_name = route.strip('/').replace('/', '_') or 'root'
+        path = os.path.join(self.profile_dir, f"{int(time.time() * 1000)}_{method}_{route_name}_{duration_ms:.0f}ms.speedscope.json")
+        with open(path, 'w') as f: # Only slow sampled requests get here, rare enough to write inline
+            f.write(profiler.output(self._renderer_class()))
+        logger.info("Slow request profile written to %s", path)
+        return path
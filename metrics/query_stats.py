@@ -0,0 +1,104 @@
+import functools, re, threading, time
+from typing import Any
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from logger.logger import logger
+
+from metrics.metrics import LATENCY_BUCKETS
+
+db_query_duration_seconds = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement latency by statement kind and table",
+    ["statement"],
+    buckets=LATENCY_BUCKETS
+)
+
+db_slow_queries_total = Counter(
+    "db_slow_queries_total",
+    "SQL statements slower than DB_SLOW_QUERY_MS",
+    ["statement"]
+)
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%s|\$\d+|:\w+)\s*,)+\s*(?:\?|%s|\$\d+|:\w+)\s*\)") # IN (?, ?, ?) -> IN (?...)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+([\w.\"]+)", re.IGNORECASE)
+
+class QueryStatsCollector:
+    # Replaces echo=True. Times every statement through cursor events, groups them by normalized text (no parameter values,
+    # so no PII) and logs only the slow ones. Stats per statement: count, total, max. Prometheus gets a coarse 'SELECT users' label
+    MAX_STATEMENTS = 500 # Distinct statements tracked. Anything beyond is counted under '<other>'
+
+    def __init__(self, slow_query_ms: float):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self._stats: dict[str, list] = {} # normalized statement -> [count, total seconds, max seconds]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024) # SQLAlchemy reuses the same compiled SQL strings -> regexes run once per statement
+    def normalize(statement: str) -> str:
+        statement = _WHITESPACE.sub(" ", statement).strip()
+        statement = _PLACEHOLDER_LIST.sub("(?...)", statement)
+        return _LITERAL.sub("?", statement)
+
+    @staticmethod
+    def fingerprint(normalized: str) -> str:
+        verb = normalized.split(" ", 1)[0].upper()
+        table = _TABLE.search(normalized)
+        return f"{verb} {table.group(1).strip(chr(34))}" if table else verb
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        normalized = self.normalize(statement)
+
+        with self._lock:
+            entry = self._stats.get(normalized)
+            if entry is None:
+                if len(self._stats) >= self.MAX_STATEMENTS:
+                    normalized = "<other>"
+                entry = self._stats.setdefault(normalized, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+        statement_label = self.fingerprint(normalized)
+        db_query_duration_seconds.labels(statement_label).observe(elapsed)
+        if elapsed >= self.slow_query_seconds:
+            db_slow_queries_total.labels(statement_label).inc()
+            logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, normalized)
+
+    def _handle_error(self, exception_context) -> None:
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop() # after_cursor_execute doesn't run for failed statements
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    def snapshot(self, top: int = 20) -> list[dict[str, Any]]:
+        # Sorted by total time: the statements worth optimizing first
+        with self._lock:
+            items = [(statement, *entry) for statement, entry in self._stats.items()]
+        items.sort(key=lambda item: item[2], reverse=True)
+        return [
+            {
+                "statement": statement,
+                "count": count,
+                "total_ms": round(total * 1000, 2),
+                "avg_ms": round(total / count * 1000, 3),
+                "max_ms": round(maximum * 1000, 2)
+            }
+            for statement, count, total, maximum in items[:top]
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Optional
+
+from redis.asyncio import ConnectionPool
+from sqlalchemy.pool import QueuePool
+
+from logger.logger import logger
+
+from configs.app_settings import settings
+from configs.database import engine, replica_router
+
+from security.password_hashing import argon2_engine
+
+from services.infrastructure.email import email_service
+
+from dependencies.token import token_cache
+
+from metrics.metrics import (
+    argon2_pending_jobs,
+    argon2_workers,
+    redis_pool_connections,
+    db_pool_connections,
+    db_replicas_healthy,
+    smtp_connections,
+    token_cache_stats
+)
+
+class MetricsSampler:
+    # Pool gauges are read every few seconds by each worker for itself. Reading them at scrape time would only
+    # ever show the worker that happened to answer /metrics
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._redis_pool: Optional[ConnectionPool] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self) -> None:
+        argon2_pending_jobs.set(argon2_engine.pending)
+        argon2_workers.set(argon2_engine.workers)
+
+        if self._redis_pool is not None:
+            redis_pool_connections.labels("in_use").set(len(self._redis_pool._in_use_connections)) # redis-py has no public accessor
+            redis_pool_connections.labels("idle").set(len(self._redis_pool._available_connections))
+            redis_pool_connections.labels("max").set(self._redis_pool.max_connections)
+
+        pool = engine.pool
+        if isinstance(pool, QueuePool): # Other pool classes (NullPool, StaticPool) don't track usage
+            db_pool_connections.labels("checked_out").set(pool.checkedout())
+            db_pool_connections.labels("idle").set(pool.checkedin())
+            db_pool_connections.labels("overflow").set(max(pool.overflow(), 0))
+            db_pool_connections.labels("size").set(pool.size())
+
+        if replica_router.enabled:
+            db_replicas_healthy.set(replica_router.healthy_count)
+
+        smtp_connections.labels("in_use").set(email_service.in_use)
+        smtp_connections.labels("idle").set(email_service.idle)
+        smtp_connections.labels("max").set(email_service.max_connections)
+
+        for stat, value in token_cache.stats().items():
+            token_cache_stats.labels(stat).set(value)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.sample()
+            except Exception:
+                logger.exception("Failed to sample pool metrics")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self, redis_pool: ConnectionPool) -> None:
+        self._redis_pool = redis_pool
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+metrics_sampler = MetricsSampler(interval_seconds=settings.METRICS_SAMPLE_INTERVAL_SECONDS)
@@ -0,0 +1,35 @@
+import asyncio
+
+from alembic import context
+from sqlalchemy import pool
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from configs.app_settings import settings
+from configs.database import Base
+from models.user import UserModel # Registers the table on Base.metadata, for 'alembic revision --autogenerate'
+
+# No fileConfig() here: it would replace the app's logging setup when migrations run inside the app
+target_metadata = Base.metadata
+
+def run_migrations_offline() -> None:
+    # 'alembic upgrade head --sql': prints the SQL instead of running it
+    context.configure(url=settings.DATABASE_URL, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def do_run_migrations(connection) -> None:
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+async def run_migrations_online() -> None:
+    # Own engine, not the app's: no pool to keep, and no DB_STATEMENT_TIMEOUT_MS. Index builds may take longer than requests
+    connectable = create_async_engine(settings.DATABASE_URL, poolclass=pool.NullPool)
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await connectable.dispose()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
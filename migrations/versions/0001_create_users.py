@@ -0,0 +1,34 @@
+"""create users
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table('users'): # Databases from before migrations (create_all on boot) only get the revision recorded
+        return
+
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=12), nullable=False),
+        sa.Column('password_hashed', sa.String(length=255), nullable=False),
+        sa.Column('email', sa.String(length=254), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('username'),
+        sa.UniqueConstraint('email')
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+
+def downgrade() -> None:
+    op.drop_index('ix_users_id', table_name='users')
+    op.drop_table('users')
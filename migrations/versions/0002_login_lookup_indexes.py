@@ -0,0 +1,36 @@
+"""indexes for case-insensitive signup checks and index-only login lookups
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_index('ix_users_username_lower', 'users', [sa.text('lower(username)')])
+        op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')])
+        return
+
+    # CONCURRENTLY: signups and logins keep writing/reading while the indexes build. It can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_username_lower', 'users', [sa.text('lower(username)')], postgresql_concurrently=True)
+        op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], postgresql_concurrently=True)
+        # Login reads id and password_hashed by username. With both in the index, Postgres answers from the index alone
+        op.create_index(
+            'ix_users_username_login', 'users', ['username'],
+            postgresql_include=['id', 'password_hashed'],
+            postgresql_concurrently=True
+        )
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_users_username_login', table_name='users')
+    op.drop_index('ix_users_email_lower', table_name='users')
+    op.drop_index('ix_users_username_lower', table_name='users')
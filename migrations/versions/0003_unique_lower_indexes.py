@@ -0,0 +1,53 @@
+"""make the lower() indexes unique: 'Alice' and 'alice' can't both exist
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ('username', 'email')
+
+def _check_no_duplicates() -> None:
+    # Rows that differ only in case would fail the index build halfway. Stop before any DDL and say which ones to merge
+    bind = op.get_bind()
+    duplicates = []
+    for column in COLUMNS:
+        rows = bind.execute(sa.text(
+            f"SELECT lower({column}), count(*) FROM users GROUP BY lower({column}) HAVING count(*) > 1 ORDER BY 1 LIMIT 20"
+        )).all()
+        duplicates += [f"{column} '{value}' x{count}" for value, count in rows]
+    if duplicates:
+        raise RuntimeError(
+            "Can't make usernames/emails unique regardless of case, these differ only in case: "
+            f"{', '.join(duplicates)}. Rename or merge them, then run the upgrade again"
+        )
+
+def _replace_indexes(unique: bool) -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        for column in COLUMNS:
+            op.drop_index(f'ix_users_{column}_lower', table_name='users')
+            op.create_index(f'ix_users_{column}_lower', 'users', [sa.text(f'lower({column})')], unique=unique)
+        return
+
+    # Build the new index next to the old one, then swap: lookups are served by one of the two all along.
+    # A duplicate inserted during the build fails it and leaves an INVALID index behind. Drop it and run again
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            name = f'ix_users_{column}_lower'
+            op.create_index(f'{name}_new', 'users', [sa.text(f'lower({column})')], unique=unique, postgresql_concurrently=True)
+            op.drop_index(name, table_name='users', postgresql_concurrently=True)
+            op.execute(f'ALTER INDEX {name}_new RENAME TO {name}')
+
+def upgrade() -> None:
+    _check_no_duplicates()
+    _replace_indexes(unique=True)
+
+def downgrade() -> None:
+    _replace_indexes(unique=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func
+from sqlalchemy import Column, Integer, String, DateTime, Index, func
 from configs.database import Base
 
 class UserModel(Base):
@@ -9,4 +9,11 @@ class UserModel(Base):
     password_hashed = Column(String(255), nullable=False)
     email = Column(String(254), nullable=False, unique=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    #server_default=func.now()... tells DB to fill the value using NOW(). More reliable than python (run at the moment of insertion, not before)
\ No newline at end of file
+    #server_default=func.now()... tells DB to fill the value using NOW(). More reliable than python (run at the moment of insertion, not before)
+
+    # Schema changes go through migrations/ (see configs/schema.py). Keep these in sync with them
+    __table_args__ = (
+        Index('ix_users_username_lower', func.lower(username), unique=True), # Unique regardless of case: 'Alice' and 'alice' can't both exist
+        Index('ix_users_email_lower', func.lower(email), unique=True),
+        Index('ix_users_username_login', username, postgresql_include=['id', 'password_hashed']).ddl_if(dialect='postgresql') # Index-only login lookup
+    )
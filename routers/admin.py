@@ -0,0 +1,20 @@
+from fastapi import Depends, Request
+from fastapi.routing import APIRouter
+
+from services.bulk_import import BulkImportService, ImportFormat
+
+from dependencies.services import get_bulk_import_service
+from dependencies.admin import require_admin_key
+
+from schemas.bulk_import import ImportReport
+
+router = APIRouter(prefix='/admin', dependencies=[Depends(require_admin_key)])
+
+@router.post('/users/import', response_model=ImportReport)
+async def import_users(
+    request: Request,
+    format: ImportFormat = 'csv',
+    bulk_import_service: BulkImportService = Depends(get_bulk_import_service)
+):
+    # Body is the raw file (text/csv or application/x-ndjson), read as a stream
+    return await bulk_import_service.import_stream(request.stream(), format)
@@ -1,31 +1,45 @@
 from fastapi import APIRouter, Depends
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.ext.asyncio import AsyncSession
-from dependencies.db import get_db
+from dependencies.services import get_auth_service
 from services.auth import AuthService
 
 from schemas.user import Credentials, CodeAndEmail
 from schemas.message import EmailConfirmMessage, UserRegisteredMessage
+from schemas.token import TokenResponse, RefreshTokenRequest
 
 router = APIRouter()
 
 @router.post('/signup/request-confirmation', response_model=EmailConfirmMessage)
 async def signup_request_confirm(
     user_credentials: Credentials,
-    db: AsyncSession = Depends(get_db)
+    auth_service: AuthService = Depends(get_auth_service)
 ):
-    return await AuthService(db).request_email_confirmation(user_credentials)
+    return await auth_service.request_email_confirmation(user_credentials)
 
 @router.post('/signup/register', response_model=UserRegisteredMessage)
 async def signup_register(
     code_and_email: CodeAndEmail,
-    db: AsyncSession = Depends(get_db) 
+    auth_service: AuthService = Depends(get_auth_service)
 ):
-    return await AuthService(db).register_user(code_and_email)
+    return await auth_service.register_user(code_and_email)
 
-@router.post('/token')
+@router.post('/token', response_model=TokenResponse)
 async def token(
     user_credentials: OAuth2PasswordRequestForm = Depends(),
-    db: AsyncSession = Depends(get_db)
+    auth_service: AuthService = Depends(get_auth_service)
 ):
-    return await AuthService(db).token(user_credentials)
\ No newline at end of file
+    return await auth_service.token(user_credentials)
+
+@router.post('/token/refresh', response_model=TokenResponse)
+async def refresh_token(
+    refresh_request: RefreshTokenRequest,
+    auth_service: AuthService = Depends(get_auth_service)
+):
+    return await auth_service.refresh_token(refresh_request)
+
+@router.post('/token/revoke')
+async def revoke_token(
+    refresh_request: RefreshTokenRequest,
+    auth_service: AuthService = Depends(get_auth_service)
+):
+    return await auth_service.revoke_token(refresh_request)
\ No newline at end of file
@@ -0,0 +1,14 @@
+from fastapi import Response
+from fastapi.routing import APIRouter
+
+from configs.app_settings import settings
+
+from security.jwt_keys import jwt_key_ring
+
+router = APIRouter()
+
+@router.get('/.well-known/jwks.json')
+def get_jwks(response: Response):
+    # Resource servers fetch this once per max-age and verify tokens locally, without calling this service
+    response.headers["Cache-Control"] = f"public, max-age={settings.JWKS_MAX_AGE_SECONDS}"
+    return jwt_key_ring.jwks()
@@ -0,0 +1,19 @@
+from fastapi import Response
+from fastapi.routing import APIRouter
+
+from configs.database import query_stats
+
+from metrics.metrics import render_latest
+
+router = APIRouter()
+
+@router.get('/metrics', include_in_schema=False)
+def get_metrics():
+    # Prometheus text format. Restrict access at the proxy/network level, it exposes internals
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+@router.get('/metrics/queries', include_in_schema=False)
+def get_query_stats(top: int = 20):
+    # Per normalized statement: count, total/avg/max time. This worker only
+    return query_stats.snapshot(top)
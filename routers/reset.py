@@ -1,10 +1,9 @@
 from fastapi import Depends
 from fastapi.routing import APIRouter
-from sqlalchemy.ext.asyncio import AsyncSession
 
 from services.reset_confirm import ResetConfirmService
 
-from dependencies.db import get_db
+from dependencies.services import get_reset_confirm_service
 from dependencies.token import get_token_from_header
 
 from schemas.user import Email, PasswordResetRequest, UsernameEmail
@@ -16,9 +15,9 @@ router = APIRouter()
 @router.post('/email/request-confirmation')
 async def send_confirm_email(
     username_email: UsernameEmail,
-    db: AsyncSession = Depends(get_db)
+    reset_confirm_service: ResetConfirmService = Depends(get_reset_confirm_service)
 ):
-    return await ResetConfirmService(db).request_email_confirm(
+    return await reset_confirm_service.request_email_confirm(
         user_email=username_email.email,
         username=username_email.username 
     )
@@ -26,9 +25,9 @@ async def send_confirm_email(
 @router.post('/password-reset-email')
 async def send_reset_password_email(
     email: Email,
-    db: AsyncSession = Depends(get_db)
+    reset_confirm_service: ResetConfirmService = Depends(get_reset_confirm_service)
 ): 
-    return await ResetConfirmService(db).request_password_reset(
+    return await reset_confirm_service.request_password_reset(
         email.address, 
     )
 
@@ -36,9 +35,9 @@ async def send_reset_password_email(
 async def reset_password(
     new_password_request: PasswordResetRequest,
     password_reset_token: TokenResponse = Depends(get_token_from_header),
-    db: AsyncSession = Depends(get_db)
+    reset_confirm_service: ResetConfirmService = Depends(get_reset_confirm_service)
 ):
-    return await ResetConfirmService(db).reset_password(
+    return await reset_confirm_service.reset_password(
         new_password_request, 
         password_reset_token
     )
\ No newline at end of file
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import List, Literal, Optional
+
+class ImportRowResult(BaseModel):
+    line: int # 1-based line in the input, header included
+    username: Optional[str] = None
+    status: Literal['conflict', 'invalid']
+    detail: str
+
+class ImportReport(BaseModel):
+    created: int = 0
+    conflicts: int = 0
+    invalid: int = 0
+    rows: List[ImportRowResult] = [] # Only rows that were not created
+    truncated: bool = False # True if there were more failed rows than the report keeps
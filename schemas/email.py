@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+from typing import Literal
+
+class EmailJob(BaseModel):
+    kind: Literal['email_confirm', 'password_reset']
+    email: str
+    username: str
+    payload: str # Confirmation code or password reset token
+    attempt: int = 0
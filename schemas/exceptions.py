@@ -17,4 +17,19 @@ class TokenCreationError(Exception):
     pass
 
 class EmailSendError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class HashingPoolSaturatedError(Exception):
+    pass
+
+class ConfirmationCodeNotFoundError(Exception):
+    pass
+
+class ConfirmationCodeMismatchError(Exception):
+    pass
+
+class RefreshTokenReuseError(Exception):
+    pass
+
+class SchemaVersionError(Exception):
+    pass
@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+
+class AttemptStatus(BaseModel):
+    blocked: bool
+    remaining: int # Failed attempts left before blocking
+    retry_after: int # Seconds until the oldest attempt leaves the window. 0 if not blocked
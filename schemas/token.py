@@ -1,8 +1,15 @@
 from pydantic import BaseModel
+from typing import Optional
 
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = 'bearer'
+    refresh_token: Optional[str] = None
 
 class TokenSub(BaseModel):
-    username: str
\ No newline at end of file
+    username: str
+    jti: Optional[str] = None
+    family: Optional[str] = None
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, model_validator, field_validator
 from datetime import datetime
+from typing import NamedTuple, Optional
 
 from utils.email_validator import validate_email_length
 
@@ -14,6 +15,10 @@ class UserSchema(BaseModel):
         "from_attributes": True # Now Pydantic can read attributes from ORM objects (not just dicts)
     }                           # It is Needed to pass models with model_validate(orm_obj)
 
+class CachedCredentials(NamedTuple): # What verify_user needs, as kept by the credential cache. Plain tuple: read on every login
+    user_id: Optional[int]
+    password_hashed: Optional[str] # None -> no such user (cached too, so unknown usernames don't hit the DB every time)
+
 class Credentials(BaseModel):
     username: str = Field(..., min_length=3, max_length=12) # '...' is required to make it not optional when using Field. Without Field, fields are required by default
     password: str = Field(..., min_length=6, max_length=30)
@@ -33,6 +38,11 @@ class CredentialsHashed(BaseModel):
     @classmethod # Needed for Pydantic firld validation
     def check_email_length(cls, v):
         return validate_email_length(v)
+
+    @classmethod
+    def from_trusted(cls, username: str, hashed_password: str, email: str) -> "CredentialsHashed":
+        # Skips validation (EmailStr checks etc). Only for data this service validated and stored itself
+        return cls.model_construct(username=username, hashed_password=hashed_password, email=email)
     
 class UsernameEmail(BaseModel):
     username: str
@@ -0,0 +1,105 @@
+import argparse, os, time
+from statistics import median
+
+from argon2 import PasswordHasher
+from pydantic import BaseModel
+
+from logger.logger import logger, configure_logging
+
+from configs.app_settings import settings
+
+MIN_MEMORY_COST = 19456 # KiB (19 MiB). OWASP minimum for Argon2id, calibration never goes below it
+MAX_TIME_COST = 10
+CALIBRATION_PASSWORD = "calibration-password"
+
+class Argon2Parameters(BaseModel):
+    time_cost: int
+    memory_cost: int # KiB
+    parallelism: int
+    verify_ms: float # Measured on this machine
+
+def _measure_verify_ms(time_cost: int, memory_cost: int, parallelism: int, rounds: int = 3) -> float:
+    ph = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    hashed = ph.hash(CALIBRATION_PASSWORD)
+
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        ph.verify(hashed, CALIBRATION_PASSWORD)
+        timings.append((time.perf_counter() - start) * 1000)
+    return median(timings) # Median, so one descheduled run doesn't skew the result
+
+def calibrate(
+    target_ms: int = settings.ARGON2_TARGET_VERIFY_MS,
+    max_memory_cost: int = settings.ARGON2_MAX_MEMORY_COST,
+    parallelism: int = settings.ARGON2_PARALLELISM
+) -> Argon2Parameters:
+    # Memory is the main defense against GPU cracking, so spend the budget on memory first, then add passes
+    memory_cost = max_memory_cost
+    verify_ms = _measure_verify_ms(1, memory_cost, parallelism)
+    while verify_ms > target_ms and memory_cost // 2 >= MIN_MEMORY_COST:
+        memory_cost //= 2 # Halving keeps values on powers of two -> similar machines end up with identical parameters
+        verify_ms = _measure_verify_ms(1, memory_cost, parallelism)
+
+    time_cost = 1
+    while time_cost < MAX_TIME_COST:
+        next_ms = _measure_verify_ms(time_cost + 1, memory_cost, parallelism)
+        if next_ms > target_ms:
+            break
+        time_cost += 1
+        verify_ms = next_ms
+
+    parameters = Argon2Parameters(
+        time_cost=time_cost,
+        memory_cost=memory_cost,
+        parallelism=parallelism,
+        verify_ms=round(verify_ms, 1)
+    )
+    logger.info("Argon2 calibrated for %s ms target: %s", target_ms, parameters.model_dump())
+    return parameters
+
+def apply_to_settings(parameters: Argon2Parameters) -> None:
+    settings.ARGON2_TIME_COST = parameters.time_cost
+    settings.ARGON2_MEMORY_COST = parameters.memory_cost
+    settings.ARGON2_PARALLELISM = parameters.parallelism
+
+def write_env_file(parameters: Argon2Parameters, path: str = '.env') -> None:
+    values = {
+        "ARGON2_TIME_COST": parameters.time_cost,
+        "ARGON2_MEMORY_COST": parameters.memory_cost,
+        "ARGON2_PARALLELISM": parameters.parallelism,
+    }
+
+    lines = []
+    if os.path.exists(path):
+        with open(path) as f:
+            lines = f.read().splitlines()
+
+    # Replace existing keys in place, append missing ones. Everything else in .env is left untouched
+    for key, value in values.items():
+        for i, line in enumerate(lines):
+            if line.split('=', 1)[0].strip() == key:
+                lines[i] = f"{key}={value}"
+                break
+        else:
+            lines.append(f"{key}={value}")
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+if __name__ == '__main__':
+    # python -m security.argon2_calibration --target-ms 250 --write-env .env
+    parser = argparse.ArgumentParser(description="Pick Argon2 parameters that meet a verify latency target on this machine")
+    parser.add_argument('--target-ms', type=int, default=settings.ARGON2_TARGET_VERIFY_MS)
+    parser.add_argument('--max-memory-cost', type=int, default=settings.ARGON2_MAX_MEMORY_COST, help="KiB")
+    parser.add_argument('--parallelism', type=int, default=settings.ARGON2_PARALLELISM)
+    parser.add_argument('--write-env', metavar='PATH', help="Persist the parameters into this env file")
+    args = parser.parse_args()
+    configure_logging()
+
+    result = calibrate(args.target_ms, args.max_memory_cost, args.parallelism)
+    print(result.model_dump_json(indent=2))
+
+    if args.write_env:
+        write_env_file(result, args.write_env)
+        print(f"Written to {args.write_env}")
@@ -0,0 +1,130 @@
+import argparse, os
+from typing import Optional, Union
+
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
+
+from logger.logger import logger
+
+from configs.app_settings import settings
+
+ASYMMETRIC_ALGORITHMS = ('RS256', 'RS384', 'RS512', 'ES256', 'ES384', 'ES512')
+
+class JwtKeyRing:
+    # HS* algorithms: tokens are signed and verified with JWT_SECRET, as before.
+    # RS*/ES* algorithms: keys are read once from JWT_KEYS_DIR. '<kid>.pem' is a private key (signs and verifies),
+    # '<kid>.pub.pem' is a retired key kept only to verify tokens issued before rotation.
+    # Rotation: add a new '<kid>.pem', point JWT_ACTIVE_KID to it, turn the old key into '<kid>.pub.pem',
+    # delete it once the longest-lived token signed with it has expired
+    def __init__(self):
+        self.algorithm = settings.ALGORITHM
+        self._loaded = False
+        self._signing_kid: Optional[str] = None
+        self._signing_key: Union[str, Key, None] = None
+        self._verification_keys: dict[str, Key] = {}
+
+    @property
+    def is_asymmetric(self) -> bool:
+        return self.algorithm in ASYMMETRIC_ALGORITHMS
+
+    def load(self) -> None:
+        if not self.is_asymmetric:
+            self._signing_key = settings.JWT_SECRET
+            self._loaded = True
+            return
+
+        if not settings.JWT_KEYS_DIR:
+            raise RuntimeError(f"JWT_KEYS_DIR must be set for {self.algorithm}")
+
+        private_kids = []
+        for file_name in sorted(os.listdir(settings.JWT_KEYS_DIR)):
+            if not file_name.endswith('.pem'):
+                continue
+
+            with open(os.path.join(settings.JWT_KEYS_DIR, file_name)) as f:
+                key = jwk.construct(f.read(), self.algorithm) # Parsing PEM is slow. Done once here, not per token
+
+            if file_name.endswith('.pub.pem'):
+                kid = file_name.removesuffix('.pub.pem')
+                self._verification_keys[kid] = key
+            else:
+                kid = file_name.removesuffix('.pem')
+                self._verification_keys[kid] = key.public_key()
+                private_kids.append((kid, key))
+
+        if not private_kids:
+            raise RuntimeError(f"No private JWT keys found in {settings.JWT_KEYS_DIR}")
+
+        private_keys = dict(private_kids)
+        self._signing_kid = settings.JWT_ACTIVE_KID or private_kids[-1][0] # Default: last key by name -> name keys by date
+        if self._signing_kid not in private_keys:
+            raise RuntimeError(f"Active JWT key '{self._signing_kid}' has no private key")
+        self._signing_key = private_keys[self._signing_kid]
+
+        self._loaded = True
+        logger.info("Loaded %s JWT keys, signing with '%s'", len(self._verification_keys), self._signing_kid)
+
+    def signing_key(self) -> tuple[Optional[str], Union[str, Key]]:
+        if not self._loaded:
+            self.load()
+        return self._signing_kid, self._signing_key
+
+    def verification_key(self, token: str) -> Union[str, Key]:
+        if not self._loaded:
+            self.load()
+        if not self.is_asymmetric:
+            return self._signing_key
+
+        kid = jwt.get_unverified_header(token).get('kid')
+        key = self._verification_keys.get(kid)
+        if key is None:
+            raise JWTError(f"Unknown key id '{kid}'")
+        return key
+
+    def jwks(self) -> dict:
+        if not self._loaded:
+            self.load()
+
+        keys = []
+        for kid, key in self._verification_keys.items(): # Empty for HS* -> a shared secret is never published
+            keys.append({
+                **key.to_dict(),
+                "kid": kid,
+                "use": "sig",
+                "alg": self.algorithm
+            })
+        return {"keys": keys}
+
+jwt_key_ring = JwtKeyRing()
+
+def generate_private_key(kid: str, keys_dir: str, algorithm: str) -> str:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa, ec
+
+    if algorithm.startswith('RS'):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        curves = {'ES256': ec.SECP256R1(), 'ES384': ec.SECP384R1(), 'ES512': ec.SECP521R1()}
+        private_key = ec.generate_private_key(curves[algorithm])
+
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+
+    os.makedirs(keys_dir, exist_ok=True)
+    path = os.path.join(keys_dir, f"{kid}.pem")
+    with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as f: # Never overwrite an existing key
+        f.write(pem)
+    return path
+
+if __name__ == '__main__':
+    # python -m security.jwt_keys --kid 2026-10 --keys-dir keys --algorithm ES256
+    parser = argparse.ArgumentParser(description="Generate a private key for JWT signing")
+    parser.add_argument('--kid', required=True)
+    parser.add_argument('--keys-dir', default=settings.JWT_KEYS_DIR or 'keys')
+    parser.add_argument('--algorithm', default=settings.ALGORITHM, choices=ASYMMETRIC_ALGORITHMS)
+    args = parser.parse_args()
+
+    print(f"Written {generate_private_key(args.kid, args.keys_dir, args.algorithm)}")
@@ -1,8 +1,31 @@
+import asyncio, os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Callable, Any
+
 from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError
+
+from logger.logger import logger
+
+from configs.app_settings import settings
+
+from schemas.exceptions import HashingPoolSaturatedError
+
+from metrics.metrics import timed
 
 class Argon2Ph:
-    def __init__(self):
-        self.ph = PasswordHasher()
+    def __init__(
+        self, 
+        time_cost: int = settings.ARGON2_TIME_COST, 
+        memory_cost: int = settings.ARGON2_MEMORY_COST, 
+        parallelism: int = settings.ARGON2_PARALLELISM
+    ):
+        self.ph = PasswordHasher(
+            time_cost=time_cost,
+            memory_cost=memory_cost,
+            parallelism=parallelism
+        )
 
     def hash_password(self, password: str) -> str:
         return self.ph.hash(password)
@@ -13,7 +36,127 @@ class Argon2Ph:
         except:
             return False
         
+    def needs_rehash(self, hashed_password: str) -> bool:
+        try:
+            return self.ph.check_needs_rehash(hashed_password) # Only parses the hash parameters. Cheap, no need for the pool
+        except InvalidHashError:
+            return False
+        
 argon2_ph = Argon2Ph()
+
+# Functions below run inside the worker processes of Argon2Engine. They must be module-level, so they can be pickled and sent to the pool
+_worker_ph: Optional[Argon2Ph] = None
+
+def _init_worker(time_cost: int, memory_cost: int, parallelism: int) -> None:
+    global _worker_ph
+    _worker_ph = Argon2Ph(time_cost, memory_cost, parallelism) # One hasher per worker process, created once when the process starts
+
+def _hash_in_worker(password: str) -> str:
+    return _worker_ph.hash_password(password)
+
+def _hash_many_in_worker(passwords: list[str]) -> list[str]:
+    return [_worker_ph.hash_password(password) for password in passwords] # One pickling round trip for the whole chunk
+
+def _verify_in_worker(hashed_password: str, password: str) -> bool:
+    return _worker_ph.verify_password(hashed_password, password)
+
+class Argon2Engine:
+    # Argon2 is CPU-bound and holds the GIL for its whole cost. Running it in the event loop freezes every other request,
+    # and a thread pool doesn't help either. A process pool runs hashes on other cores while the loop keeps serving requests
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending # Submitted but not finished jobs (running + waiting). Above this we fail fast instead of queueing forever
+        self._pending = 0 # Only touched from the event loop thread -> no lock needed
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._restart_lock = asyncio.Lock()
+        self.configure(settings.ARGON2_TIME_COST, settings.ARGON2_MEMORY_COST, settings.ARGON2_PARALLELISM)
+
+    def configure(self, time_cost: int, memory_cost: int, parallelism: int) -> None:
+        self.parameters = (time_cost, memory_cost, parallelism)
+        self.ph = Argon2Ph(*self.parameters) # Used in this process for needs_rehash only
+
+        if self._executor is not None: # Workers were initialized with old parameters -> restart them
+            self.shutdown()
+            self.start()
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, 
+                initializer=_init_worker,
+                initargs=self.parameters
+            )
+            logger.info("Argon2 engine started with %s worker processes, parameters (t, m, p) = %s", self.workers, self.parameters)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            logger.info("Argon2 engine stopped")
+
+    async def stop(self) -> None:
+        # shutdown() from async code. Waiting for in-flight hashes blocks, so it happens in a thread while the loop keeps
+        # running the other shutdown steps and draining requests
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+            logger.info("Argon2 engine stopped")
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def _submit(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self.max_pending:
+            logger.warning("Argon2 engine saturated: %s jobs pending", self._pending)
+            raise HashingPoolSaturatedError("Password hashing queue is full")
+
+        self.start() # No-op if the pool is already running
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._executor
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool: # Once, in case the job itself is what kills the worker
+                await self._replace_broken(executor)
+                return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def _replace_broken(self, broken: ProcessPoolExecutor) -> None:
+        # A worker process died (OOM killer, segfault). The pool stays broken for good: every job would raise BrokenProcessPool.
+        # Jobs failing together wait on the lock, the first one replaces the pool and the rest find it already replaced
+        async with self._restart_lock:
+            if self._executor is not broken:
+                return
+            logger.error("Argon2 worker process died, restarting the pool")
+            await asyncio.to_thread(broken.shutdown, wait=True, cancel_futures=True) # Reaps the remaining processes
+            self._executor = None
+            self.start()
+
+    @timed("argon2")
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash_in_worker, password)
+
+    @timed("argon2")
+    async def hash_many(self, passwords: list[str]) -> list[str]:
+        # Counts as one pending job. Bulk import sends chunks of passwords, so per-job overhead is paid once per chunk
+        return await self._submit(_hash_many_in_worker, passwords)
+
+    @timed("argon2") # Includes waiting for a free worker. That wait is what a login actually pays for
+    async def verify(self, hashed_password: str, password: str) -> bool:
+        return await self._submit(_verify_in_worker, hashed_password, password)
+    
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return self.ph.needs_rehash(hashed_password)
+
+_argon2_workers = settings.ARGON2_POOL_WORKERS or os.cpu_count() or 1
+
+argon2_engine = Argon2Engine(
+    workers=_argon2_workers,
+    max_pending=settings.ARGON2_MAX_PENDING or _argon2_workers * 4
+)
 # Another way to do it. Supports multiple schemes -> switching is easy. Use the first, if committed to Argon2 only.
 # from passlib.context import CryptContext
 
@@ -27,4 +170,4 @@ argon2_ph = Argon2Ph()
 #     return pwd_context.hash(password)
 
 # def verify_password(plain_password: str, hashed_password: str | None) -> bool:
-#     return pwd_context.verify(plain_password, hashed_password) 
\ No newline at end of file
+#     return pwd_context.verify(plain_password, hashed_password) 
@@ -0,0 +1,150 @@
+import argparse, glob, importlib.util, os, shutil, tempfile, warnings
+from typing import Optional
+
+from configs.app_settings import settings
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError: # No gunicorn on Windows. For development: uvicorn app:app --reload
+    raise SystemExit("server.py needs gunicorn: pip install gunicorn uvicorn-worker")
+
+try:
+    from uvicorn_worker import UvicornWorker
+except ImportError:
+    with warnings.catch_warnings(): # Same class, deprecated in uvicorn in favour of the uvicorn-worker package
+        warnings.simplefilter("ignore", DeprecationWarning)
+        from uvicorn.workers import UvicornWorker
+
+# python server.py                                  - WEB_WORKERS (default: one per CPU core) on WEB_BIND
+# python server.py --workers 4 --bind 127.0.0.1:8000 --pid server.pid
+#
+# gunicorn master + uvicorn workers. The app is imported once in the master (preload) and forked, so workers start without
+# importing anything and share its memory pages (app.py keeps them out of GC passes, which would copy them). Each worker runs
+# the lifespan itself: connections, the Argon2 pool, log listener and background tasks are created after the fork, never inherited.
+# Signals to the master:
+#   HUP   - graceful worker restart: new workers start, old ones finish in-flight requests (WEB_GRACEFUL_TIMEOUT). Same code
+#           unless started with --no-preload
+#   USR2  - starts a new master running the code on disk, on the same socket. Then QUIT the old one: zero-downtime upgrade
+#   TERM  - graceful shutdown
+
+UVLOOP = importlib.util.find_spec("uvloop") is not None
+HTTPTOOLS = importlib.util.find_spec("httptools") is not None
+
+class ServerWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "uvloop" if UVLOOP else "asyncio", # Faster event loop and HTTP parser when installed, pure Python otherwise
+        "http": "httptools" if HTTPTOOLS else "h11",
+        "lifespan": "on" # A worker whose startup fails (schema check, Redis) exits instead of serving errors
+    }
+
+MIN_REQUEST_REDIS_CONNECTIONS = 4 # Per worker, on top of the background ones. Fewer and requests mostly wait for the pool
+
+def redis_background_connections() -> int:
+    # Held by each worker for its whole life: the revocation and credential-cache pub/sub listeners, the blocking XREADGROUP
+    # of every email consumer, and the email maintenance task. Requests only get what is left of the pool
+    return 1 + int(settings.CREDENTIAL_CACHE_ENABLED) + settings.EMAIL_WORKERS + 1
+
+def size_for_workers(workers: int) -> None:
+    # Pools are per process. Called in the master before the app is imported, so every worker is built with its share
+    cpus = os.cpu_count() or 1
+    if settings.ARGON2_POOL_WORKERS is None:
+        settings.ARGON2_POOL_WORKERS = max(1, cpus // workers) # Hashing processes of all workers ~ cores. More only take turns on the same cores
+
+    if settings.DB_TOTAL_CONNECTIONS:
+        per_worker = max(1, settings.DB_TOTAL_CONNECTIONS // workers)
+        pool_size = max(1, per_worker * settings.DB_POOL_SIZE // (settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW))
+        settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW = pool_size, per_worker - pool_size
+
+    background = redis_background_connections()
+    if settings.REDIS_TOTAL_CONNECTIONS: # Background connections are reserved first, the rest is split for requests
+        request_share = (settings.REDIS_TOTAL_CONNECTIONS - workers * background) // workers
+        settings.REDIS_MAX_CONNECTIONS = background + max(request_share, 0)
+
+    if settings.REDIS_MAX_CONNECTIONS < background + MIN_REQUEST_REDIS_CONNECTIONS:
+        raise SystemExit(
+            f"Redis pool of {settings.REDIS_MAX_CONNECTIONS} connections per worker is too small: each of the {workers} workers "
+            f"holds {background} for background tasks and needs at least {MIN_REQUEST_REDIS_CONNECTIONS} more for requests. "
+            f"Raise REDIS_TOTAL_CONNECTIONS (or REDIS_MAX_CONNECTIONS) to {workers * (background + MIN_REQUEST_REDIS_CONNECTIONS)}+, "
+            f"or run fewer workers or EMAIL_WORKERS"
+        )
+
+def _prepare_metrics_dir() -> None:
+    # Each worker has its own counters. In multiprocess mode they write to files in this directory and /metrics sums them up.
+    # Must be set before prometheus_client is imported, i.e. before the app is loaded
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        os.makedirs(path, exist_ok=True)
+        for stale in glob.glob(os.path.join(path, "*.db")): # Left by a previous run. Would be summed in
+            os.remove(stale)
+    else:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+
+def _prepare_schema() -> None:
+    if settings.SCHEMA_STARTUP_MODE == 'upgrade': # Once here, instead of every worker migrating at the same time
+        from configs.schema import upgrade
+        upgrade()
+        settings.SCHEMA_STARTUP_MODE = 'verify'
+
+def _prepare_argon2() -> None:
+    # Once here, before any worker exists. Workers calibrating at the same time measure each other's load, and each may pick
+    # different parameters: needs_rehash() would then rehash a user's password back and forth depending on the worker
+    if settings.ARGON2_CALIBRATE_ON_STARTUP:
+        from security.argon2_calibration import calibrate, apply_to_settings
+        apply_to_settings(calibrate())
+        settings.ARGON2_CALIBRATE_ON_STARTUP = False # Workers inherit the calibrated settings
+
+def _when_ready(server) -> None:
+    server.log.info("Serving on %s with %s workers (loop: %s, http: %s, Argon2 processes per worker: %s, (t, m, p) = %s)",
+                    ", ".join(server.cfg.bind), server.cfg.workers, ServerWorker.CONFIG_KWARGS["loop"],
+                    ServerWorker.CONFIG_KWARGS["http"], settings.ARGON2_POOL_WORKERS,
+                    (settings.ARGON2_TIME_COST, settings.ARGON2_MEMORY_COST, settings.ARGON2_PARALLELISM))
+
+def _child_exit(server, worker) -> None:
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid) # Drops the dead worker's live gauges, keeps its counters
+
+def _on_exit(server) -> None:
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    if os.path.basename(path).startswith("prometheus-"): # Only the one we created
+        shutil.rmtree(path, ignore_errors=True)
+
+class ProductionServer(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app
+        return app
+
+def run(workers: int, bind: str, preload: bool = True, pidfile: Optional[str] = None) -> None:
+    size_for_workers(workers)
+    _prepare_metrics_dir()
+    _prepare_schema()
+    _prepare_argon2()
+
+    ProductionServer({
+        "bind": bind,
+        "workers": workers,
+        "worker_class": ServerWorker,
+        "preload_app": preload,
+        "graceful_timeout": settings.WEB_GRACEFUL_TIMEOUT,
+        "keepalive": settings.WEB_KEEPALIVE_SECONDS,
+        "pidfile": pidfile,
+        "when_ready": _when_ready,
+        "child_exit": _child_exit,
+        "on_exit": _on_exit
+    }).run()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the app with multiple worker processes")
+    parser.add_argument('--workers', type=int, default=settings.WEB_WORKERS or os.cpu_count() or 1)
+    parser.add_argument('--bind', default=settings.WEB_BIND)
+    parser.add_argument('--no-preload', action='store_true', help="Every worker imports the app. Slower starts, but HUP reloads code")
+    parser.add_argument('--pid', help="Write the master's pid to this file")
+    args = parser.parse_args()
+    run(args.workers, args.bind, preload=not args.no_preload, pidfile=args.pid)
@@ -1,72 +1,81 @@
 from logger.logger import logger
 
+from uuid import uuid4
+
 from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 
-from sqlalchemy.ext.asyncio import AsyncSession
-
 from services.infrastructure.db import DbService
 from services.infrastructure.token import token_service
+from services.infrastructure.existence_filter import existence_filter
 from services.reset_confirm import ResetConfirmService
 from services.infrastructure.redis import (
     redis_attempt_limiter,
-    redis_user_for_signup,
-    redis_email_code
+    redis_user_for_signup
 )
 
-from security.password_hashing import argon2_ph
-
-from models.user import UserModel
+from security.password_hashing import argon2_engine
 
 from schemas.user import Credentials, UserSchema, CredentialsHashed, CodeAndEmail
 from schemas.message import EmailConfirmMessage, UserRegisteredMessage
-from schemas.token import TokenResponse
+from schemas.token import TokenResponse, RefreshTokenRequest
 from schemas.exceptions import (
     DatabaseError, 
     UserAlreadyExistsError,   
-    TokenCreationError
+    TokenCreationError,
+    HashingPoolSaturatedError,
+    ConfirmationCodeNotFoundError,
+    ConfirmationCodeMismatchError,
+    TokenNotFoundError,
+    InvalidTokenError
 )
 
 class AuthService:
-    def __init__(self, db: AsyncSession):
-        self.db_service = DbService(db)
-        self.helper = AuthServiceHelper(db)
+    # Built per request by dependencies.services. Shares the request's DbService with its helper and ResetConfirmService
+    def __init__(self, db_service: DbService, reset_confirm_service: ResetConfirmService):
+        self.db_service = db_service
+        self.helper = AuthServiceHelper(db_service)
+        self.reset_confirm_service = reset_confirm_service
 
     async def request_email_confirmation(self, credentials: Credentials) -> EmailConfirmMessage:
-        logger.info(f"Signup attempt for user '{credentials.username}'")
+        logger.info("Signup attempt for user '%s'", credentials.username)
         
         await self.helper.ensure_user_does_not_exist(credentials)
-        
-        credentials_hashed = self.helper.hash_credentials(credentials)
 
-        await redis_user_for_signup.store_user_for_signup(credentials_hashed, 30)
+        message = EmailConfirmMessage(message=f"An email with confirmation code was sent to {credentials.email}")
 
-        await ResetConfirmService(self.db_service).request_email_confirm(
-            user_email=credentials.email,
-            username=credentials.username
-        )
+        code = await self.reset_confirm_service.claim_email_confirm(credentials.email)
+        try: # Stored on every request, cooldown or not: a repeat may correct the password or username
+            credentials_hashed = await self.helper.hash_credentials(credentials)
+            await redis_user_for_signup.store_user_for_signup(credentials_hashed, 30)
+        except Exception:
+            if code is not None:
+                await self.reset_confirm_service.release_email_confirm(credentials.email)
+            raise
 
-        return EmailConfirmMessage(
-            message=f"An email with confirmation code was sent to {credentials_hashed.email}"
+        if code is None: # Repeat inside the cooldown: the code already sent confirms the data just stored
+            return message
+
+        await self.reset_confirm_service.send_email_confirm(
+            user_email=credentials.email,
+            username=credentials.username,
+            code=code
         )
+        return message
     
     async def register_user(self, code_and_email: CodeAndEmail) -> UserRegisteredMessage:
-        logger.info(f"Email code verification attempt for user '{code_and_email.email}'")
-        await self.helper.verify_email_confirmation_code(code_and_email)
-        
-        stored_credentials = await redis_user_for_signup.get_user_for_signup(code_and_email.email)
+        logger.info("Email code verification attempt for user '%s'", code_and_email.email)
+        stored_credentials = await self.helper.consume_email_confirmation_code(code_and_email)
         new_user = await self.helper.insert_new_user(stored_credentials)
 
-        await redis_email_code.delete_email_confirmation_code(code_and_email.email)
-
-        logger.info(f"User with id {new_user.id} registered successfully")
+        logger.info("User with id %s registered successfully", new_user.id)
         return UserRegisteredMessage(
             message=f"User {new_user.username} registered successfully"
         )
 
     async def token(self, credentials: OAuth2PasswordRequestForm) -> TokenResponse:
         try:
-            logger.info(f"Login attempt for username: {credentials.username}")
+            logger.info("Login attempt for username: %s", credentials.username)
 
             await self.helper.check_if_blocked(credentials)
             
@@ -78,53 +87,101 @@ class AuthService:
             return await self.helper.create_token(credentials)
         
         except (TokenCreationError, DatabaseError):
-            logger.exception(f"Unexpected error during token generation")
+            logger.exception("Unexpected error during token generation")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Token generation error"
             )
+        
+        except HashingPoolSaturatedError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later"
+            )
+
+    async def refresh_token(self, refresh_request: RefreshTokenRequest) -> TokenResponse:
+        try:
+            new_refresh_token, username, family = await token_service.rotate_refresh_token(refresh_request.refresh_token)
+            access_token = token_service.create_access_token(
+                username=username,
+                expires_minutes=15,
+                family=family
+            )
+            logger.info("Access token refreshed for user %s", username)
+            return TokenResponse(access_token=access_token, token_type='bearer', refresh_token=new_refresh_token)
+        
+        except (TokenNotFoundError, InvalidTokenError):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid refresh token"
+            )
+        
+        except TokenCreationError:
+            logger.exception("Unexpected error during token refresh")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Token generation error"
+            )
+        
+    async def revoke_token(self, refresh_request: RefreshTokenRequest) -> None:
+        try:
+            await token_service.revoke_refresh_token(refresh_request.refresh_token)
+        
+        except TokenNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid refresh token"
+            )
 
 class AuthServiceHelper:
-    def __init__(self, db: AsyncSession):
-        self.db_service = DbService(db)
+    def __init__(self, db_service: DbService):
+        self.db_service = db_service
     
     async def ensure_user_does_not_exist(self, credentials: Credentials) -> None:
+        if not await existence_filter.might_exist(credentials.username, credentials.email):
+            logger.info("%s doesn't exist (existence filter)", credentials.username)
+            return
+
         existing_users = await self.db_service.get_user_by_username_or_email(
                 credentials.username, 
                 credentials.email
             )
             
-        if len(existing_users) == 2:
-            logger.info(f"Signup rejected: username and email already in use for {credentials.email}")
+        # Decided per value, not by row count: one row can hold both, or two rows one each
+        username_taken = any(user.username.lower() == credentials.username.lower() for user in existing_users)
+        email_taken = any(user.email.lower() == credentials.email.lower() for user in existing_users)
+
+        if username_taken and email_taken:
+            logger.info("Signup rejected: username and email already in use for %s", credentials.email)
             raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST, 
                     detail="Username and email already in use"
                 )
         
-        elif len(existing_users) == 1:
-            user: UserModel = existing_users[0] 
-            if user.username == credentials.username:
-                logger.info(f"Signup rejected: username already in use for '{credentials.username}'")
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST, 
-                    detail="Username already exists")
-            
-            if user.email == credentials.email:
-                logger.info(f"Signup rejected: email already in use for {credentials.email}")
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Email already in use"
-                )
+        if username_taken:
+            logger.info("Signup rejected: username already in use for '%s'", credentials.username)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, 
+                detail="Username already exists")
         
-        elif len(existing_users) == 0:
-            logger.info(f"{credentials.username} doesn't exist")
-            return
-
-        else:
-            raise DatabaseError("Unexpected number of users found")
+        if email_taken:
+            logger.info("Signup rejected: email already in use for %s", credentials.email)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already in use"
+            )
+        
+        logger.info("%s doesn't exist", credentials.username)
         
-    def hash_credentials(self, credentials: Credentials) -> CredentialsHashed:
-        hashed_password = argon2_ph.hash_password(credentials.password)
+    async def hash_credentials(self, credentials: Credentials) -> CredentialsHashed:
+        try:
+            hashed_password = await argon2_engine.hash(credentials.password)
+        except HashingPoolSaturatedError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later"
+            )
+
         user_credentials_hashed = CredentialsHashed(
             username=credentials.username,
             hashed_password=hashed_password,
@@ -132,28 +189,33 @@ class AuthServiceHelper:
         )
         return user_credentials_hashed
     
-    async def verify_email_confirmation_code(self, code_and_email: CodeAndEmail) -> None:
-        code_redis = await redis_email_code.get_email_confirmation_code(code_and_email.email)
-        if code_redis is None:
-            logger.info(f"Confirmation code for '{code_and_email.email} not found or expired'")
+    async def consume_email_confirmation_code(self, code_and_email: CodeAndEmail) -> CredentialsHashed:
+        try:
+            credentials_hashed = await redis_user_for_signup.consume_user_for_signup(
+                code_and_email.email,
+                code_and_email.code
+            )
+            logger.info("Email code for '%s' confirmed successfully", code_and_email.email)
+            return credentials_hashed
+        
+        except ConfirmationCodeNotFoundError:
+            logger.info("Confirmation code for '%s' not found or expired", code_and_email.email)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Code expired or doesn't exist"
             )
-        if code_and_email.code == code_redis:
-            logger.info(f"Email code for '{code_and_email.email} confirmed successfully'")
-            return
         
-        logger.info(f"Incorrect email code attempt for '{code_and_email.email}'")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Codes do not match"
-        )
+        except ConfirmationCodeMismatchError:
+            logger.info("Incorrect email code attempt for '%s'", code_and_email.email)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Codes do not match"
+            )
     
     async def insert_new_user(self, credentials_hashed: CredentialsHashed) -> UserSchema:
         try:
             new_user = await self.db_service.insert_user(credentials_hashed)
-            logger.info(f"User {credentials_hashed.email} successfully registered")
+            logger.info("User %s successfully registered", credentials_hashed.email)
             return UserSchema.model_validate(new_user)
 
         except UserAlreadyExistsError:
@@ -164,7 +226,7 @@ class AuthServiceHelper:
         
         except DatabaseError:
             logger.exception(
-                f"Unexpected error during signup for {credentials_hashed.username} / {credentials_hashed.email}"
+                "Unexpected error during signup for %s / %s", credentials_hashed.username, credentials_hashed.email
             )
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -172,26 +234,30 @@ class AuthServiceHelper:
             )
         
     async def check_if_blocked(self, credentials: Credentials) -> None:
-        is_blocked = await redis_attempt_limiter.is_blocked(credentials.username)
-        if is_blocked:
+        attempt_status = await redis_attempt_limiter.check_attempts(credentials.username)
+        if attempt_status.blocked:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Too many attempts"
+                detail="Too many attempts",
+                headers={"Retry-After": str(attempt_status.retry_after)}
             )
         
     async def create_token(self, credentials: Credentials) -> TokenResponse:
+        family = uuid4().hex # New login -> new refresh token family
         access_token = token_service.create_access_token(
             username=credentials.username,
-            expires_minutes=15
+            expires_minutes=15,
+            family=family
         )
+        refresh_token = await token_service.create_refresh_token(credentials.username, family)
 
-        logger.info(f"Access token issued for user {credentials.username}")
+        logger.info("Access token issued for user %s", credentials.username)
         await redis_attempt_limiter.reset_attempts(credentials.username)
-        return TokenResponse(access_token=access_token, token_type='bearer')
+        return TokenResponse(access_token=access_token, token_type='bearer', refresh_token=refresh_token)
         
     async def register_login_attempt(self, credentials: Credentials) -> None:
         await redis_attempt_limiter.register_attempt(credentials.username)
-        logger.info(f"Failed login attempt for username: {credentials.username}")
+        logger.info("Failed login attempt for username: %s", credentials.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
@@ -0,0 +1,280 @@
+import argparse, asyncio, csv, json, os
+from typing import AsyncIterator, Literal, NamedTuple, Optional
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import select, or_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from logger.logger import logger, configure_logging
+
+from configs.app_settings import settings
+
+from models.user import UserModel
+
+from security.password_hashing import argon2_engine
+
+from services.infrastructure.existence_filter import existence_filter
+from services.infrastructure.credential_cache import credential_cache
+
+from schemas.user import Credentials, CredentialsHashed
+from schemas.bulk_import import ImportReport, ImportRowResult
+from schemas.exceptions import DatabaseError, HashingPoolSaturatedError
+
+ImportFormat = Literal['csv', 'ndjson']
+
+MAX_REPORTED_ROWS = 10000 # Failed rows listed in the report. Counts stay exact beyond that
+
+class _PendingRow(NamedTuple):
+    line: int
+    username: str
+    email: str
+    password: Optional[str] # Plain password to hash, or None if the input had a hash
+    password_hashed: Optional[str]
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # Splits a byte stream (e.g. a request body) into lines without holding the whole input in memory
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig")
+    if buffer:
+        yield buffer.decode("utf-8-sig")
+
+async def iter_records(lines: AsyncIterator[str], input_format: ImportFormat) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    # Yields (line number, record, error). CSV needs a header row and one record per line.
+    # Columns/keys: username, email and either password or password_hashed (an Argon2 hash, stored as is)
+    header: Optional[list[str]] = None
+    line_number = 0
+
+    async for line in lines:
+        line_number += 1
+        line = line.rstrip("\r")
+        if not line.strip():
+            continue
+
+        if input_format == 'csv':
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [value.strip() for value in values]
+                continue
+            if len(values) != len(header):
+                yield line_number, None, f"Expected {len(header)} columns, got {len(values)}"
+                continue
+            yield line_number, dict(zip(header, values)), None
+            continue
+
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, None, f"Invalid JSON: {e.msg}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        yield line_number, record, None
+
+def _validation_detail(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()) # Never the input values: they hold passwords
+
+def _validate(line: int, record: dict) -> _PendingRow:
+    # Same rules as signup. Raises ValueError (ValidationError is one)
+    password_hashed = record.get("password_hashed")
+    if password_hashed:
+        if not str(password_hashed).startswith("$argon2"):
+            raise ValueError("password_hashed must be an Argon2 hash")
+        credentials_hashed = CredentialsHashed(username=record.get("username"), hashed_password=password_hashed, email=record.get("email"))
+        return _PendingRow(line, credentials_hashed.username, credentials_hashed.email, None, credentials_hashed.hashed_password)
+
+    credentials = Credentials(username=record.get("username"), password=record.get("password"), email=record.get("email"))
+    return _PendingRow(line, credentials.username, credentials.email, credentials.password, None)
+
+class BulkImportService:
+    def __init__(self, db: AsyncSession, hash_concurrency: Optional[int] = None):
+        self.db = db
+        self.batch_size = settings.BULK_IMPORT_BATCH_SIZE
+        self.hash_chunk = settings.BULK_IMPORT_HASH_CHUNK
+        self.hash_concurrency = hash_concurrency or settings.BULK_IMPORT_HASH_CONCURRENCY or max(1, argon2_engine.workers // 2)
+
+    @staticmethod
+    def _add_failure(report: ImportReport, result: ImportRowResult) -> None:
+        if result.status == 'conflict':
+            report.conflicts += 1
+        else:
+            report.invalid += 1
+
+        if len(report.rows) < MAX_REPORTED_ROWS:
+            report.rows.append(result)
+        else:
+            report.truncated = True
+
+    async def _hash_chunk(self, passwords: list[str]) -> list[str]:
+        while True:
+            try:
+                return await argon2_engine.hash_many(passwords)
+            except HashingPoolSaturatedError:
+                await asyncio.sleep(0.05) # Logins have priority. Wait for room in the pool instead of failing the import
+
+    async def _hash_passwords(self, rows: list[_PendingRow]) -> list[_PendingRow]:
+        to_hash = [row for row in rows if row.password_hashed is None]
+        chunks = [to_hash[i:i + self.hash_chunk] for i in range(0, len(to_hash), self.hash_chunk)]
+        semaphore = asyncio.Semaphore(self.hash_concurrency)
+
+        async def hash_chunk(chunk: list[_PendingRow]) -> None:
+            async with semaphore:
+                hashes = await self._hash_chunk([row.password for row in chunk])
+            for row, password_hashed in zip(chunk, hashes):
+                hashed_rows[row.line] = row._replace(password=None, password_hashed=password_hashed)
+
+        hashed_rows = {row.line: row for row in rows if row.password_hashed is not None}
+        await asyncio.gather(*(hash_chunk(chunk) for chunk in chunks))
+        return [hashed_rows[row.line] for row in rows]
+
+    def _insert_statement(self):
+        dialect = self.db.bind.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise DatabaseError(f"Bulk import is not supported for '{dialect}'")
+        # ON CONFLICT DO NOTHING: a duplicate skips its row instead of aborting the batch. RETURNING tells which rows got in.
+        # No conflict target, so it covers every unique index: 'Alice' next to an existing 'alice' is skipped too (migration 0003)
+        return insert(UserModel.__table__).on_conflict_do_nothing().returning(UserModel.username, UserModel.email)
+
+    async def _insert_batch(self, rows: list[_PendingRow], report: ImportReport) -> None:
+        values = [{"username": row.username, "password_hashed": row.password_hashed, "email": row.email} for row in rows]
+
+        try:
+            result = await self.db.execute(self._insert_statement(), values) # executemany, batched into multi-row INSERTs by SQLAlchemy
+            inserted = set(result.all())
+
+            created, conflicting = [], []
+            for row in rows:
+                if (row.username, row.email) in inserted:
+                    inserted.discard((row.username, row.email)) # The same pair twice in the input: only the first one is created
+                    created.append((row.username, row.email))
+                else:
+                    conflicting.append(row)
+
+            if conflicting:
+                existing = await self.db.execute(
+                    select(UserModel.username, UserModel.email).where(or_( # Case-insensitive, like the unique indexes that skipped them
+                        func.lower(UserModel.username).in_([row.username.lower() for row in conflicting]),
+                        func.lower(UserModel.email).in_([row.email.lower() for row in conflicting])
+                    ))
+                )
+                existing_usernames, existing_emails = set(), set()
+                for username, email in existing:
+                    existing_usernames.add(username.lower())
+                    existing_emails.add(email.lower())
+
+                for row in conflicting:
+                    detail = "Username already in use" if row.username.lower() in existing_usernames else "Email already in use"
+                    self._add_failure(report, ImportRowResult(line=row.line, username=row.username, status='conflict', detail=detail))
+
+            await self.db.commit() # One commit per batch. A failure later doesn't undo what is already imported
+            report.created += len(created)
+
+        except DatabaseError:
+            raise
+
+        except Exception as e:
+            await self.db.rollback()
+            logger.exception("Unexpected error while inserting import batch")
+            raise DatabaseError("Failed to insert import batch") from e
+
+        await existence_filter.add(created)
+        await credential_cache.invalidate(*(username for username, _ in created)) # Drops cached 'no such user' entries
+
+    async def _import_batch(self, rows: list[_PendingRow], report: ImportReport) -> None:
+        await self._insert_batch(await self._hash_passwords(rows), report)
+        logger.info("Bulk import progress: %s created, %s conflicts, %s invalid", report.created, report.conflicts, report.invalid)
+
+    async def import_records(self, records: AsyncIterator[tuple[int, Optional[dict], Optional[str]]]) -> ImportReport:
+        report = ImportReport()
+        batch: list[_PendingRow] = []
+
+        async for line, record, error in records:
+            if error is not None:
+                self._add_failure(report, ImportRowResult(line=line, status='invalid', detail=error))
+                continue
+
+            try:
+                batch.append(_validate(line, record))
+            except ValidationError as e:
+                self._add_failure(report, ImportRowResult(line=line, username=record.get("username"), status='invalid', detail=_validation_detail(e)))
+                continue
+            except ValueError as e:
+                self._add_failure(report, ImportRowResult(line=line, username=record.get("username"), status='invalid', detail=str(e)))
+                continue
+
+            if len(batch) >= self.batch_size:
+                await self._import_batch(batch, report)
+                batch = []
+
+        if batch:
+            await self._import_batch(batch, report)
+
+        report.rows.sort(key=lambda row: row.line) # Conflicts are only known after their batch, invalid rows right away
+        logger.info("Bulk import finished: %s created, %s conflicts, %s invalid", report.created, report.conflicts, report.invalid)
+        return report
+
+    async def import_stream(self, chunks: AsyncIterator[bytes], input_format: ImportFormat) -> ImportReport:
+        try:
+            return await self.import_records(iter_records(iter_lines(chunks), input_format))
+
+        except DatabaseError as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Import stopped: {e}. Batches before the failure were committed"
+            )
+
+async def _file_lines(path: str) -> AsyncIterator[str]:
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f: # Blocking reads are fine in the CLI, nothing else runs on its loop
+            yield line.rstrip("\n")
+
+async def _run_cli(path: str, input_format: ImportFormat, report_path: Optional[str]) -> ImportReport:
+    from redis.asyncio import Redis
+    from configs.database import async_session, engine
+    from configs.schema import verify_schema
+    from configs.redis import create_redis_pool
+    from services.infrastructure.redis import bind_redis_services
+
+    await verify_schema()
+    redis_pool = create_redis_pool()
+    redis_client = Redis(connection_pool=redis_pool)
+    bind_redis_services(redis_client) # Imported users go into the existence filter, same as signups
+    argon2_engine.start()
+    try:
+        async with async_session() as session:
+            service = BulkImportService(session, hash_concurrency=argon2_engine.workers) # Nothing else to serve -> every core hashes
+            report = await service.import_records(iter_records(_file_lines(path), input_format))
+    finally:
+        await argon2_engine.stop()
+        await redis_client.aclose()
+        await redis_pool.disconnect()
+        await engine.dispose()
+
+    if report_path:
+        with open(report_path, "w") as f:
+            f.write(report.model_dump_json(indent=2))
+    return report
+
+if __name__ == '__main__':
+    # python -m services.bulk_import users.csv --report import_report.json
+    parser = argparse.ArgumentParser(description="Import users from CSV or NDJSON")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), help="Default: from the file extension")
+    parser.add_argument('--report', help="Write the full report (failed rows included) to this JSON file")
+    args = parser.parse_args()
+    configure_logging()
+
+    input_format = args.format or ('ndjson' if os.path.splitext(args.path)[1] in ('.ndjson', '.jsonl') else 'csv')
+    report = asyncio.run(_run_cli(args.path, input_format, args.report))
+    print(f"Created {report.created}, conflicts {report.conflicts}, invalid {report.invalid}")
+    for row in report.rows[:20]:
+        print(f"  line {row.line}: {row.status} - {row.detail}")
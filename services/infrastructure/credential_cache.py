@@ -0,0 +1,120 @@
+import asyncio, json, time
+from logger.logger import logger
+
+from typing import Awaitable, Callable, Optional
+
+from configs.app_settings import settings
+
+from services.infrastructure.redis import redis_credential_cache, RedisCredentialCache
+
+from schemas.user import CachedCredentials
+
+from utils.ttl_cache import TTLCache
+
+from metrics.metrics import credential_cache_lookups_total
+
+class CredentialCache:
+    # Read-through cache for the username -> password hash lookup at login. Two tiers: a small in-process LRU (no round trip)
+    # and Redis (shared by workers). Writers call invalidate() after commit. It drops the Redis entry, bumps its generation
+    # and tells every worker over pub/sub to drop its local copy.
+    # Stale fills are refused: Redis compares the generation read before the DB load, locally any invalidation seen during a
+    # load (the epoch) skips the local fill. Argon2 verify always runs, so a cache can never let a wrong password in
+    def __init__(self, enabled: bool, local_ttl_seconds: float, local_max_size: int):
+        self.enabled = enabled
+        self.local_ttl_seconds = local_ttl_seconds
+        self._local = TTLCache(max_size=local_max_size)
+        self._epoch = 0 # Bumped by every invalidation this worker sees
+        self._task: Optional[asyncio.Task] = None
+
+    def _drop_local(self, usernames: list[str]) -> None:
+        self._epoch += 1
+        for username in usernames:
+            self._local.delete(username)
+
+    async def get_or_load(
+        self,
+        username: str,
+        loader: Callable[[str], Awaitable[CachedCredentials]]
+    ) -> CachedCredentials:
+        if not self.enabled:
+            return await loader(username)
+
+        epoch = self._epoch
+        credentials = self._local.get(username)
+        if credentials is not None:
+            credential_cache_lookups_total.labels("local").inc()
+            return credentials
+
+        generation = None
+        try:
+            generation, credentials = await redis_credential_cache.get(username)
+        except Exception:
+            logger.exception("Credential cache read failed for '%s', falling back to DB", username)
+
+        if credentials is not None:
+            credential_cache_lookups_total.labels("redis").inc()
+        else:
+            credential_cache_lookups_total.labels("db").inc()
+            credentials = await loader(username)
+            if generation is not None:
+                try:
+                    await redis_credential_cache.fill(username, generation, credentials)
+                except Exception:
+                    logger.exception("Credential cache fill failed for '%s'", username) # Login goes on, next one reads the DB again
+
+        if epoch == self._epoch:
+            self._local.set(username, credentials, time.time() + self.local_ttl_seconds)
+        return credentials
+
+    async def invalidate(self, *usernames: str) -> None:
+        # Call after the write is committed
+        if not self.enabled or not usernames:
+            return
+
+        self._drop_local(list(usernames))
+        try:
+            await redis_credential_cache.invalidate(list(usernames))
+        except Exception:
+            logger.exception("Failed to invalidate cached credentials for %s users", len(usernames)) # Entries still expire on their TTLs
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = redis_credential_cache.client.pubsub()
+            try:
+                await pubsub.subscribe(RedisCredentialCache.CHANNEL)
+                self._epoch += 1
+                self._local.clear() # Messages sent while unsubscribed are lost. Start over instead of trusting what is cached
+
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self._drop_local(json.loads(message["data"]))
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception:
+                logger.exception("Credential cache lost connection to Redis, resubscribing")
+                await asyncio.sleep(1)
+
+            finally:
+                await pubsub.aclose()
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+credential_cache = CredentialCache(
+    enabled=settings.CREDENTIAL_CACHE_ENABLED,
+    local_ttl_seconds=settings.CREDENTIAL_CACHE_LOCAL_TTL_SECONDS,
+    local_max_size=settings.CREDENTIAL_CACHE_LOCAL_MAX_SIZE
+)
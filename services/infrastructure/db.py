@@ -1,30 +1,68 @@
 from logger.logger import logger
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, OperationalError, InterfaceError
 from sqlalchemy.future import select
-from sqlalchemy import or_, update
+from sqlalchemy import func, or_, update, Select
+from sqlalchemy.engine import Result
+
+from configs.database import replica_router
 
 from models.user import UserModel
 
-from schemas.user import CredentialsHashed
-from schemas.exceptions import DatabaseError, UserAlreadyExistsError, UserNotFound
+from schemas.user import CredentialsHashed, CachedCredentials
+from schemas.exceptions import DatabaseError, UserAlreadyExistsError, UserNotFound, HashingPoolSaturatedError
+
+from security.password_hashing import argon2_engine
+
+from services.infrastructure.redis import redis_recent_writes
+from services.infrastructure.existence_filter import existence_filter
+from services.infrastructure.credential_cache import credential_cache
 
-from security.password_hashing import argon2_ph
+from metrics.metrics import timed, stage_timer
 
 from typing import Optional, List
 
 class DbService:
     def __init__(self, db: AsyncSession):
+        self.db = db # Nothing here can fail or needs logging: one of these is built per request
 
+    async def _execute_read(
+        self,
+        statement: Select,
+        username: Optional[str] = None,
+        email: Optional[str] = None
+    ) -> Result:
+        # Pure reads go to a replica, unless this user wrote recently (their write may not have replicated yet)
+        if not replica_router.enabled or await redis_recent_writes.is_recent(username, email):
+            return await self.db.execute(statement)
+
+        self.db.info["use_replica"] = True # Read by RoutingSession.get_bind
+        self.db.info.pop("replica", None) # Left over from an earlier read of this session
         try:
-            self.db = db
-            logger.info("DB service initialized successfully")
+            return await self.db.execute(statement)
+
+        except (OperationalError, InterfaceError): # Replica unreachable or dropped the connection
+            replica = self.db.info.pop("replica", None)
+            if replica is None:
+                raise
+            replica_router.mark_down(replica)
+            await self.db.rollback()
+            self.db.info["use_replica"] = False
+            return await self.db.execute(statement) # Same read on the primary
+
+        finally:
+            self.db.info["use_replica"] = False
 
+    async def _mark_recent_write(self, username: Optional[str] = None, email: Optional[str] = None) -> None:
+        if not replica_router.enabled:
+            return
+        try:
+            await redis_recent_writes.mark(username, email)
         except Exception:
-            logger.critical("Failed to initialize DB service")
-            raise # 'raise' is better that 'raise e' because in this case traceback starts where the error happened. 'raise e' traces back where it was caught (right where 'raise e' is written, which is not useful)
+            logger.exception("Failed to mark recent write for '%s'", username or email) # The write itself succeeded. Don't fail it
 
+    @timed("db")
     async def get_user_by_username_or_email(
         self, 
         username: Optional[str] = None, 
@@ -32,14 +70,16 @@ class DbService:
     ) -> List[UserModel]:
         
         try:
-            conditions = []
+            conditions = [] # Case-insensitive, like the unique lower() indexes that serve it (migration 0003): at most one row per value
             if username:
-                conditions.append(UserModel.username == username) # Doesn't append True of False. SQLAlchemy overrides '==' to return an SQL expression 
+                conditions.append(func.lower(UserModel.username) == username.lower()) # Doesn't append True of False. SQLAlchemy overrides '==' to return an SQL expression 
             if email:
-                conditions.append(UserModel.email == email)
+                conditions.append(func.lower(UserModel.email) == email.lower())
 
-            result = await self.db.execute(
-                select(UserModel).where(or_(*conditions)) # or_ doesn't take list as argument. Unpack the list with unpacking operator *
+            result = await self._execute_read(
+                select(UserModel).where(or_(*conditions)), # or_ doesn't take list as argument. Unpack the list with unpacking operator *
+                username=username,
+                email=email
             )
             return result.scalars().all() # Returns a list of ORM objects 
         
@@ -48,6 +88,7 @@ class DbService:
             logger.exception("Unexpected error while fetching user")
             raise DatabaseError("Failed to get user") from e
         
+    @timed("db")
     async def insert_user(
         self, 
         credentials_hashed: CredentialsHashed
@@ -63,11 +104,14 @@ class DbService:
             self.db.add(new_user)
             await self.db.commit()
             await self.db.refresh(new_user) # after adding and commit, new_user may not have all fields populated (auto-generated id, default values Timestamp)
+            await self._mark_recent_write(new_user.username, new_user.email)
+            await existence_filter.add([(new_user.username, new_user.email)])
+            await credential_cache.invalidate(new_user.username) # May be cached as 'no such user'
             return new_user
         
         except IntegrityError as e: # Occurs when constraints are violated (unique, not null, fks)
             await self.db.rollback() # Always rollback on error
-            logger.info(f"IntegrityError while inserting user: username={credentials_hashed.username}, email={credentials_hashed.email}")
+            logger.info("IntegrityError while inserting user: username=%s, email=%s", credentials_hashed.username, credentials_hashed.email)
             raise UserAlreadyExistsError("Username or email already in use") from e
         
         except Exception as e:
@@ -82,28 +126,67 @@ class DbService:
     ) -> bool:
         
         try:
-            result = await self.db.execute(
-                select(UserModel.password_hashed).where(UserModel.username == username)
-            )
-            hashed_password = result.scalar_one_or_none()
+            credentials = await credential_cache.get_or_load(username, self._load_credentials)
+            hashed_password = credentials.password_hashed
 
             if hashed_password is None:
-                logger.info(f"Login failed: user not found or password incorrect for '{username}'")
+                logger.info("Login failed: user not found or password incorrect for '%s'", username)
                 return False
             
-            is_valid_password = argon2_ph.verify_password(hashed_password, password)
+            is_valid_password = await argon2_engine.verify(hashed_password, password)
+            if is_valid_password and argon2_engine.needs_rehash(hashed_password):
+                await self._rehash_password(username, hashed_password, password)
+
             return is_valid_password
         
+        except HashingPoolSaturatedError:
+            raise # Not a DB failure. Let the caller answer with 503
+        
         except Exception as e:
             logger.exception("Unexpected error while verifying user")
             raise DatabaseError("Unexpected database error during user verification") from e
         
+    async def _load_credentials(self, username: str) -> CachedCredentials:
+        with stage_timer("db", "DbService.verify_user"): # Query only. Argon2 is timed on its own
+            result = await self._execute_read(
+                select(UserModel.id, UserModel.password_hashed).where(UserModel.username == username),
+                username=username
+            )
+        row = result.one_or_none()
+        return CachedCredentials(row.id, row.password_hashed) if row else CachedCredentials(None, None)
+
+    async def _rehash_password(
+        self,
+        username: str,
+        old_password_hashed: str,
+        password: str
+    ) -> None:
+        # Plain password is only available at login. Use it to migrate old hashes to current Argon2 parameters
+        try:
+            new_password_hashed = await argon2_engine.hash(password)
+            with stage_timer("db", "DbService._rehash_password"):
+                await self.db.execute(
+                    update(UserModel)
+                    .where(UserModel.username == username, UserModel.password_hashed == old_password_hashed) # Don't overwrite a concurrent password reset
+                    .values(password_hashed=new_password_hashed)
+                )
+                await self.db.commit()
+            await credential_cache.invalidate(username) # Otherwise the cached old hash triggers another rehash on every login
+            logger.info("Password hash upgraded to current parameters for user '%s'", username)
+
+        except HashingPoolSaturatedError:
+            logger.info("Password rehash skipped for user '%s': hashing pool is busy", username) # Will be retried on next login
+
+        except Exception:
+            await self.db.rollback()
+            logger.exception("Failed to rehash password for user '%s'", username) # Login itself already succeeded. Don't fail it
+
     async def update_password(
         self, 
         username: str, 
         new_password: str
     ) -> None:
-        new_password_hashed = argon2_ph.hash_password(new_password)
+        new_password_hashed = await argon2_engine.hash(new_password) # Raises HashingPoolSaturatedError before touching DB
 
         try:
             statement = (
@@ -111,14 +194,17 @@ class DbService:
                 .where(UserModel.username == username)
                 .values(password_hashed=new_password_hashed)
             )
-            result = await self.db.execute(statement)
+            with stage_timer("db", "DbService.update_password"):
+                result = await self.db.execute(statement)
 
-            if result.rowcount == 0:
-                logger.info(f"User '{username}' not found in DB during password update")
-                raise UserNotFound(f"User '{username} not found'")
-            
-            await self.db.commit()
-            logger.info(f"Password updated for user '{username}'")
+                if result.rowcount == 0:
+                    logger.info("User '%s' not found in DB during password update", username)
+                    raise UserNotFound(f"User '{username} not found'")
+                
+                await self.db.commit()
+            await credential_cache.invalidate(username) # Other workers drop their local copy when the pub/sub message arrives
+            await self._mark_recent_write(username)
+            logger.info("Password updated for user '%s'", username)
 
         except Exception as e:
             await self.db.rollback()
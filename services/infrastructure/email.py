@@ -1,65 +1,128 @@
 from logger.logger import logger
 
-import yagmail
+import queue, threading, time
+from typing import List, Optional
 
 from configs.app_settings import settings
 
 from utils.email_contents import EmailContents
 
+from schemas.email import EmailJob
 from schemas.exceptions import EmailSendError
 
-class EmailService:
+from metrics.metrics import stage_timer
+
+class _SmtpConnection:
+    # yagmail's send() logs in again on every call (new TCP + TLS + AUTH). We log in once and reuse the underlying smtplib connection
+    IDLE_CHECK_SECONDS = 60 # Servers drop idle connections. After this long unused, NOOP before sending
+
     def __init__(self):
-        self.yag = yagmail.SMTP(settings.YAGMAIL_MY_EMAIL)
-
-    def _send_email(
-        self, 
-        to: str, 
-        subject: str, 
-        contents: str
-    ) -> None: # Turn VPN off before sending
-        
-        try:
-            self.yag.send(
-                to=to,
-                subject=subject,
-                contents=contents
-            )
-
-        except Exception as e:
-            logger.exception("Unexpected error while sending email")
-            raise EmailSendError from e
-
-    def send_password_reset_email(
-        self, 
-        email: str, 
-        username: str, 
-        token: str
-    ) -> None:
-        
-        text_fallback = EmailContents.get_plain_text_password_reset(username, token)
-        html_content = EmailContents.get_html_password_reset(username, token)
-        self._send_email(
-            email,
-            subject="Password reset",
-            contents=[text_fallback, html_content]
+        import yagmail # First send happens in the email worker thread, not at import
+        self.yag = yagmail.SMTP(
+            settings.YAGMAIL_MY_EMAIL,
+            host=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            smtp_ssl=settings.SMTP_SSL,
+            smtp_starttls=settings.SMTP_STARTTLS,
+            smtp_skip_login=settings.SMTP_SKIP_LOGIN # True for a local SMTP stand-in
         )
-        logger.info(f"Password reset link sent to {email}")
-
-    def send_email_confirm(
-        self, 
-        email: str, 
-        username: str,
-        code: str
-    ) -> None:
-        
-        text_fallback = EmailContents.get_plain_text_email_confirm(username, code)
-        html_content = EmailContents.get_html_email_confirm(username, code)
-        self._send_email(
-            email,
-            subject="Email confirmation",
-            contents=[text_fallback, html_content]
+        self._connected = False
+        self._last_used = 0.0
+
+    def _ensure_connected(self) -> None:
+        if self._connected and time.monotonic() - self._last_used > self.IDLE_CHECK_SECONDS:
+            try:
+                self.yag.smtp.noop()
+            except Exception:
+                self._connected = False
+
+        if not self._connected:
+            self.yag.login()
+            self._connected = True
+
+    def send(self, to: str, subject: str, contents: List[str]) -> None:
+        self._ensure_connected()
+        recipients, message = self.yag.prepare_send(
+            to=to, subject=subject, contents=contents, attachments=None, cc=None, bcc=None,
+            headers=None, prettify_html=True, message_id=None, group_messages=True
         )
-        logger.info(f"Email confirmation code sent to {email}")
-        
-email_service = EmailService()
\ No newline at end of file
+        try:
+            self.yag.smtp.sendmail(self.yag.user, recipients, message)
+            self._last_used = time.monotonic()
+        except Exception:
+            self.close() # Connection state is unknown after a failure. Next send reconnects
+            raise
+
+    def close(self) -> None:
+        self._connected = False
+        self.yag.close()
+
+class EmailService:
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self._idle: queue.LifoQueue[_SmtpConnection] = queue.LifoQueue() # LIFO reuses the warmest connection
+        self._created = 0
+        self._lock = threading.Lock()
+        self._available = threading.Semaphore(max_connections)
+
+    def _acquire(self) -> _SmtpConnection:
+        self._available.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self._created += 1
+            return _SmtpConnection() # Connects lazily on first send
+
+    def _release(self, connection: _SmtpConnection) -> None:
+        self._idle.put(connection)
+        self._available.release()
+
+    @property
+    def in_use(self) -> int:
+        return self._created - self._idle.qsize()
+
+    @property
+    def idle(self) -> int:
+        return self._idle.qsize()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    @staticmethod
+    def _build_email(job: EmailJob) -> tuple[str, List[str]]:
+        if job.kind == 'password_reset':
+            return "Password reset", [
+                EmailContents.get_plain_text_password_reset(job.username, job.payload),
+                EmailContents.get_html_password_reset(job.username, job.payload)
+            ]
+        return "Email confirmation", [
+            EmailContents.get_plain_text_email_confirm(job.username, job.payload),
+            EmailContents.get_html_email_confirm(job.username, job.payload)
+        ]
+
+    def send_batch(self, jobs: List[EmailJob]) -> List[Optional[Exception]]:
+        # Blocking. Runs in a worker thread. All jobs of a batch go through one connection. Returns an error (or None) per job
+        errors: List[Optional[Exception]] = []
+        connection = self._acquire()
+        try:
+            for job in jobs:
+                subject, contents = self._build_email(job)
+                try:
+                    with stage_timer("email", job.kind):
+                        connection.send(job.email, subject, contents)
+                    errors.append(None)
+                    logger.info("Email '%s' sent to %s", job.kind, job.email)
+
+                except Exception as e:
+                    logger.exception("Unexpected error while sending email '%s' to %s", job.kind, job.email)
+                    errors.append(EmailSendError(str(e)))
+        finally:
+            self._release(connection)
+        return errors
+
+email_service = EmailService(max_connections=settings.EMAIL_SMTP_CONNECTIONS)
@@ -0,0 +1,109 @@
+import asyncio, os, socket
+from concurrent.futures import ThreadPoolExecutor
+from logger.logger import logger
+
+from typing import List, Optional
+
+from configs.app_settings import settings
+
+from services.infrastructure.email import email_service
+from services.infrastructure.redis import redis_email_queue
+
+from schemas.email import EmailJob
+
+class EmailQueueWorker:
+    # Consumes the Redis email queue in the background. HTTP handlers only enqueue and return
+    BLOCK_MS = 1000 # Must stay below REDIS_SOCKET_TIMEOUT
+    MAINTENANCE_INTERVAL = 1 # seconds between promoting due retries
+    STALE_AFTER_MS = 60_000 # A job read but not acked for this long belongs to a dead worker
+
+    def __init__(self, workers: int, batch_size: int, max_retries: int, retry_base_seconds: float):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self._consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _process(self, entries: list[tuple[bytes, EmailJob]]) -> None:
+        jobs = [job for _, job in entries]
+        loop = asyncio.get_running_loop()
+        errors = await loop.run_in_executor(self._executor, email_service.send_batch, jobs) # SMTP is blocking -> dedicated threads
+
+        sent_ids = [entry_id for (entry_id, _), error in zip(entries, errors) if error is None]
+        if sent_ids:
+            await redis_email_queue.ack(sent_ids)
+
+        for (entry_id, job), error in zip(entries, errors):
+            if error is None:
+                continue
+            job.attempt += 1
+            if job.attempt > self.max_retries:
+                await redis_email_queue.dead_letter(entry_id, job)
+            else:
+                delay = self.retry_base_seconds * 2 ** (job.attempt - 1)
+                await redis_email_queue.retry_later(entry_id, job, delay)
+                logger.info("Email '%s' to %s will be retried in %s s (attempt %s)", job.kind, job.email, delay, job.attempt)
+
+    async def _consume(self, consumer: str) -> None:
+        while True:
+            try:
+                entries = await redis_email_queue.read_batch(consumer, self.batch_size, self.BLOCK_MS)
+                if entries:
+                    await self._process(entries)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception:
+                logger.exception("Email queue consumer error")
+                await asyncio.sleep(1)
+
+    async def _maintain(self, consumer: str) -> None:
+        while True:
+            try:
+                await redis_email_queue.promote_due()
+                stale_entries = await redis_email_queue.claim_stale(consumer, self.STALE_AFTER_MS, self.batch_size)
+                if stale_entries:
+                    logger.info("Reclaimed %s stale email jobs", len(stale_entries))
+                    await self._process(stale_entries)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception:
+                logger.exception("Email queue maintenance error")
+
+            await asyncio.sleep(self.MAINTENANCE_INTERVAL)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        await redis_email_queue.ensure_group()
+        self._executor = ThreadPoolExecutor(max_workers=email_service.max_connections, thread_name_prefix="smtp")
+
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._consume(f"{self._consumer_prefix}-{i}")))
+        self._tasks.append(asyncio.create_task(self._maintain(f"{self._consumer_prefix}-maintenance")))
+        logger.info("Email queue started with %s consumers", self.workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True) # Unacked jobs stay pending and get reclaimed by another worker
+        self._tasks = []
+
+        # Both block: waiting for in-flight SMTP sends, then QUIT on every pooled connection. In threads, like Argon2Engine.stop,
+        # so the loop keeps running the other shutdown steps and draining requests
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            await asyncio.to_thread(executor.shutdown, wait=True)
+        await asyncio.to_thread(email_service.close)
+
+email_queue_worker = EmailQueueWorker(
+    workers=settings.EMAIL_WORKERS,
+    batch_size=settings.EMAIL_BATCH_SIZE,
+    max_retries=settings.EMAIL_MAX_RETRIES,
+    retry_base_seconds=settings.EMAIL_RETRY_BASE_SECONDS
+)
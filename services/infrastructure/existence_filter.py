@@ -0,0 +1,106 @@
+import asyncio, time
+from logger.logger import logger
+
+from typing import Optional
+
+from sqlalchemy import select
+
+from configs.app_settings import settings
+from configs.database import async_session
+
+from models.user import UserModel
+
+from services.infrastructure.redis import redis_existence_filter
+
+from metrics.metrics import existence_filter_checks_total
+
+class ExistenceFilter:
+    # Answers "is this username/email definitely not taken?" without the DB. Most signup attempts (bots with random names included)
+    # are for free values, and those skip the OR query. A 'maybe' still goes to the DB, which stays the authority.
+    # If an add is lost (Redis down during an insert), a later signup for that user passes this check and is stopped
+    # by the unique constraint at register instead. The next rebuild picks the user up
+    BUILD_CHUNK = 5000 # Rows streamed from the DB and written to Redis at a time
+
+    def __init__(self, enabled: bool, rebuild_seconds: int):
+        self.enabled = enabled
+        self.rebuild_seconds = rebuild_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def might_exist(self, username: Optional[str] = None, email: Optional[str] = None) -> bool:
+        if not self.enabled:
+            return True
+
+        try:
+            maybe = await redis_existence_filter.might_contain(username, email)
+        except Exception:
+            existence_filter_checks_total.labels("unavailable").inc()
+            logger.exception("Existence filter check failed, falling back to DB")
+            return True
+
+        existence_filter_checks_total.labels("maybe" if maybe else "absent").inc()
+        return maybe
+
+    async def add(self, users: list[tuple[str, str]]) -> None:
+        # Call after the insert is committed
+        if not self.enabled or not users:
+            return
+
+        try:
+            await redis_existence_filter.add(users)
+        except Exception:
+            logger.exception("Failed to add %s users to existence filter", len(users)) # The insert itself succeeded. Don't fail it
+
+    async def rebuild(self) -> int:
+        # Into a separate key, swapped in when done. Inserts made meanwhile are added to both
+        await redis_existence_filter.begin_build(expires_seconds=self.rebuild_seconds)
+        count = 0
+
+        async with async_session() as session: # Primary, not a replica: a user missing here would be missing from the filter
+            result = await session.stream(
+                select(UserModel.username, UserModel.email).execution_options(yield_per=self.BUILD_CHUNK)
+            )
+            async for partition in result.partitions():
+                await redis_existence_filter.add_to_build([(username, email) for username, email in partition])
+                count += len(partition)
+
+        await redis_existence_filter.finish_build()
+        return count
+
+    async def _build(self) -> None:
+        try:
+            if not await redis_existence_filter.acquire_build_lock(self.rebuild_seconds):
+                logger.info("Existence filter was rebuilt recently, skipping")
+                return
+
+            start = time.perf_counter()
+            try:
+                count = await self.rebuild()
+            except BaseException:
+                await redis_existence_filter.release_build_lock() # Let the next startup try again
+                raise
+            logger.info("Existence filter built from %s users in %.1f s", count, time.perf_counter() - start)
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception:
+            logger.exception("Failed to build existence filter") # Until one is built, every check says 'maybe' -> DB
+
+    def start(self) -> None:
+        # In the background: startup doesn't wait for a full table scan
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._build())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+existence_filter = ExistenceFilter(
+    enabled=settings.EXISTENCE_FILTER_ENABLED,
+    rebuild_seconds=settings.EXISTENCE_FILTER_REBUILD_SECONDS
+)
@@ -3,107 +3,271 @@ from logger.logger import logger
 from typing import Optional
 
 from redis.asyncio import Redis
-import json
+from redis.exceptions import ResponseError
+import hashlib, json, math, time
+from uuid import uuid4
 
 from configs.app_settings import settings
 
 from datetime import timedelta
 
-from schemas.user import CredentialsHashed
+from services.infrastructure.serializers import SignupRecordSerializer
+
+from metrics.metrics import timed
+
+from schemas.user import CredentialsHashed, CachedCredentials
+from schemas.limiter import AttemptStatus
+from schemas.email import EmailJob
+from schemas.exceptions import (
+    ConfirmationCodeNotFoundError, 
+    ConfirmationCodeMismatchError,
+    TokenNotFoundError,
+    RefreshTokenReuseError
+)
 
 class _RedisBase:
     def __init__(self):
-        try:
-            self.client = Redis(
-                host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                db=settings.REDIS_DB
-            )
-            logger.info(f"Redis service initialized on port {settings.REDIS_PORT}")
-        except Exception:
-            logger.critical("Failed to initialize Redis service")
-            raise # 'raise' is better that 'raise e' because traceback starts where the error happened, not where it was caught (raise e)
+        self._client: Optional[Redis] = None # Bound in the app lifespan. Nothing connects at import time
+
+    def bind(self, client: Redis) -> None:
+        self._client = client
+
+    @property
+    def client(self) -> Redis:
+        if self._client is None:
+            raise RuntimeError(f"{type(self).__name__} used before Redis pool was created")
+        return self._client
+
+# Sliding window over a sorted set of failed attempts (score = time in ms). Trim, count, add and read retry-after in one atomic call
+# KEYS[1] - attempts key. ARGV: now_ms, window_ms, max_attempts, member to add ('' -> only check)
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local max_attempts = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local attempts = redis.call('ZCARD', key)
+
+if ARGV[4] ~= '' and attempts < max_attempts then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, window)
+    attempts = attempts + 1
+end
+
+local retry_after = 0
+if attempts >= max_attempts then
+    local unblocking = redis.call('ZRANGE', key, attempts - max_attempts, attempts - max_attempts, 'WITHSCORES')
+    retry_after = tonumber(unblocking[2]) + window - now
+end
+return {attempts, retry_after}
+"""
 
 class RedisAttemptLimiter(_RedisBase):
-    MAX_ATTEMPTS = 5
-    EXPIRATION_TIME = 15 # seconds
+    def __init__(self, max_attempts: int, window_seconds: int):
+        super().__init__()
+        self.max_attempts = max_attempts
+        self.window_ms = window_seconds * 1000
+
+    def bind(self, client: Redis) -> None:
+        super().bind(client)
+        self._sliding_window = client.register_script(SLIDING_WINDOW_SCRIPT) # EVALSHA, falls back to EVAL if script isn't cached on server
 
     def _get_key_login_fail(self, username: str) -> str:
         return f"login_fail:{username}"
     
-    async def register_attempt(self, username: str) -> None:
+    async def _run_sliding_window(self, username: str, member: str) -> AttemptStatus:
         key = self._get_key_login_fail(username)
+        now_ms = int(time.time() * 1000)
 
-        await self.client.incr(key) # incr also returns incremented value
-        await self.client.expire(key, self.EXPIRATION_TIME)
-        logger.info(f"Login attempt failed for user '{username}'")
-
-    async def is_blocked(self, username: str) -> bool:
-        key = self._get_key_login_fail(username)
+        attempts, retry_after_ms = await self._sliding_window(
+            keys=[key], 
+            args=[now_ms, self.window_ms, self.max_attempts, member]
+        )
+        return AttemptStatus(
+            blocked=attempts >= self.max_attempts,
+            remaining=max(self.max_attempts - attempts, 0),
+            retry_after=math.ceil(retry_after_ms / 1000)
+        )
+    
+    @timed("redis")
+    async def register_attempt(self, username: str) -> AttemptStatus:
+        member = f"{time.time_ns()}:{uuid4().hex[:8]}" # Unique, so two failures in the same millisecond are both counted
+        attempt_status = await self._run_sliding_window(username, member)
+        logger.info("Login attempt failed for user '%s', %s attempts remaining", username, attempt_status.remaining)
+        return attempt_status
 
-        attempts: bytes = await self.client.get(key) # returns bytes or None -> converting is needed
-        if attempts and int(attempts) >= self.MAX_ATTEMPTS:
-            logger.info(f"Login limit exceeded: user '{username}' temporarily blocked")
-            return True
-        return False
+    @timed("redis")
+    async def check_attempts(self, username: str) -> AttemptStatus:
+        attempt_status = await self._run_sliding_window(username, '')
+        if attempt_status.blocked:
+            logger.info("Login limit exceeded: user '%s' temporarily blocked for %s s", username, attempt_status.retry_after)
+        return attempt_status
     
+    @timed("redis")
     async def reset_attempts(self, username: str) -> None:
         key = self._get_key_login_fail(username)
 
         await self.client.delete(key)
-        logger.info(f"Login attempts reset for user '{username}'")
+        logger.info("Login attempts reset for user '%s'", username)
 
 class RedisPasswordResetToken(_RedisBase):
     def _get_key_password_reset_token(self, username: str) -> str:
         return f"password_reset_token:{username}"
 
+    @staticmethod
+    def _get_key_password_reset_cooldown(username: str) -> str:
+        return f"password_reset_cooldown:{username}"
+
+    @timed("redis")
+    async def claim_password_reset_send(self, username: str, cooldown_seconds: int) -> bool:
+        # SET NX: of concurrent or repeated requests inside the cooldown, only the first one gets to send. 0 -> no cooldown
+        if cooldown_seconds <= 0:
+            return True
+        return bool(await self.client.set(self._get_key_password_reset_cooldown(username), 1, nx=True, ex=cooldown_seconds))
+
+    @timed("redis")
+    async def release_password_reset_cooldown(self, username: str) -> None:
+        # The send failed. Let the user retry right away
+        await self.client.delete(self._get_key_password_reset_cooldown(username))
+
+    @timed("redis")
     async def store_password_reset_token(self, username: str, token: str, expires_minutes: int) -> None:
         key = self._get_key_password_reset_token(username)
 
         await self.client.setex(key, timedelta(minutes=expires_minutes), token) # No need to json.dumps plain string
-        logger.info(f"Password reset token stored for user '{username} for {expires_minutes} minutes'")
+        logger.info("Password reset token stored for user '%s for %s minutes'", username, expires_minutes)
 
+    @timed("redis")
     async def get_password_reset_token(self, username: str) -> Optional[str]:
         key = self._get_key_password_reset_token(username)
 
         token: bytes = await self.client.get(key)
-        logger.info(f"Password reset token fetched for user '{username}'")
+        logger.info("Password reset token fetched for user '%s'", username)
         return token.decode() if token else None # json.loads converts JSON str into dict. Not what I need.
 
+    @timed("redis")
     async def expire_password_reset_token(self, username: str) -> None:
         key = self._get_key_password_reset_token(username)
 
         await self.client.delete(key)
-        logger.info(f"Password reset token expired for user '{username}'")
+        logger.info("Password reset token expired for user '%s'", username)
+
+# Validates the code and takes both the code and the pending signup in one atomic call. Concurrent retries can't both succeed
+# KEYS[1] - email confirmation code, KEYS[2] - pending signup. ARGV[1] - code from the user
+CONSUME_SIGNUP_SCRIPT = """
+local code = redis.call('GET', KEYS[1])
+if not code then
+    return {0}
+end
+if code ~= ARGV[1] then
+    return {-1}
+end
+
+local user_info = redis.call('GET', KEYS[2])
+redis.call('DEL', KEYS[1], KEYS[2])
+if not user_info then
+    return {0}
+end
+return {1, user_info}
+"""
 
 class RedisUserForSignup(_RedisBase):
-    def _get_key_stored_user_for_signup(self, email: str) -> str:
-        return f"signup:{email}"
+    def __init__(self, serializer: SignupRecordSerializer):
+        super().__init__()
+        self.serializer = serializer
+
+    def bind(self, client: Redis) -> None:
+        super().bind(client)
+        self._consume_signup = client.register_script(CONSUME_SIGNUP_SCRIPT)
+
+    @staticmethod
+    def _get_key_stored_user_for_signup(email: str) -> str:
+        return f"signup:{email.lower()}" # Lowercased like the confirmation code keys
     
+    @timed("redis")
     async def store_user_for_signup(self, user_info: CredentialsHashed, expires_minutes: int) -> None:
         key = self._get_key_stored_user_for_signup(user_info.email)
 
-        await self.client.setex(key, timedelta(minutes=expires_minutes), json.dumps(user_info.model_dump()))
-        logger.info(f"Stored user info for signup for '{user_info.email}' for {expires_minutes} minutes")
+        await self.client.setex(key, timedelta(minutes=expires_minutes), self.serializer.dumps(user_info))
+        logger.info("Stored user info for signup for '%s' for %s minutes", user_info.email, expires_minutes)
 
+    @timed("redis")
     async def get_user_for_signup(self, user_email: str) -> CredentialsHashed:
         key = self._get_key_stored_user_for_signup(user_email)
 
         user_info_bytes: bytes = await self.client.get(key)
-        user_info_dict: dict = json.loads(user_info_bytes.decode())
 
-        logger.info(f"Fetched user info for '{user_email}'")
-        return CredentialsHashed(**user_info_dict)
+        logger.info("Fetched user info for '%s'", user_email)
+        return self.serializer.loads(user_info_bytes)
     
+    @timed("redis")
+    async def consume_user_for_signup(self, user_email: str, code: str) -> CredentialsHashed:
+        code_key = RedisEmailCode._get_key_email_confirmation_code(user_email)
+        signup_key = self._get_key_stored_user_for_signup(user_email)
+
+        result = await self._consume_signup(keys=[code_key, signup_key], args=[code])
+        if result[0] == 0:
+            raise ConfirmationCodeNotFoundError(f"Confirmation code or signup data for '{user_email}' not found or expired")
+        if result[0] == -1:
+            raise ConfirmationCodeMismatchError(f"Confirmation code for '{user_email}' doesn't match")
+
+        logger.info("Consumed confirmation code and signup data for '%s'", user_email)
+        return self.serializer.loads(result[1])
+    
+# Claims the send cooldown of an address and picks the code to send, in one atomic call. Inside the cooldown nothing is sent.
+# Outside it, a pending code is sent again (its TTL restarts) instead of a new one, so every email the user got stays valid
+# KEYS[1] - email confirmation code, KEYS[2] - send cooldown. ARGV: new code, code TTL in seconds, cooldown in seconds (0 -> none)
+CLAIM_EMAIL_CODE_SCRIPT = """
+if tonumber(ARGV[3]) > 0 and not redis.call('SET', KEYS[2], 1, 'NX', 'EX', ARGV[3]) then
+    return {0}
+end
+
+local code = redis.call('GET', KEYS[1])
+if code then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return {1, code}
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return {1, ARGV[1]}
+"""
+
 class RedisEmailCode(_RedisBase):
-    def _get_key_email_confirmation_code(self, email: str) -> str:
-        return f"email_confirm:{email}"
+    def bind(self, client: Redis) -> None:
+        super().bind(client)
+        self._claim_code = client.register_script(CLAIM_EMAIL_CODE_SCRIPT)
+
+    @staticmethod
+    def _get_key_email_confirmation_code(email: str) -> str:
+        return f"email_confirm:{email.lower()}" # Case variations of one address share the code, its cooldown and the signup data
 
+    @staticmethod
+    def _get_key_email_confirmation_cooldown(email: str) -> str:
+        return f"email_confirm_cooldown:{email.lower()}"
+
+    @timed("redis")
+    async def claim_email_confirmation_code(self, email: str, code: str, expires_minutes: int, cooldown_seconds: int) -> Optional[str]:
+        # Returns the code to send: the pending one if there is one, else 'code'. None -> a code was sent inside the cooldown
+        result = await self._claim_code(
+            keys=[self._get_key_email_confirmation_code(email), self._get_key_email_confirmation_cooldown(email)],
+            args=[code, expires_minutes * 60, max(cooldown_seconds, 0)]
+        )
+        if result[0] == 0:
+            return None
+        return result[1].decode() if isinstance(result[1], bytes) else result[1]
+
+    @timed("redis")
+    async def release_email_confirmation_cooldown(self, email: str) -> None:
+        # The send failed. Let the user retry right away
+        await self.client.delete(self._get_key_email_confirmation_cooldown(email))
+
+    @timed("redis")
     async def store_email_confirmation_code(self, code: str, email: str, expires_minutes: int) -> None:
         key = self._get_key_email_confirmation_code(email)
         await self.client.setex(key, timedelta(minutes=expires_minutes), code)
-        logger.info(f"Stored email confirmation code for '{email} for {expires_minutes} minutes'")
+        logger.info("Stored email confirmation code for '%s for %s minutes'", email, expires_minutes)
 
+    @timed("redis")
     async def get_email_confirmation_code(self, email: str) -> Optional[str]:
         key = self._get_key_email_confirmation_code(email)
 
@@ -113,20 +277,404 @@ class RedisEmailCode(_RedisBase):
         
         try:
             code_str = str(code_bytes.decode())
-            logger.info(f"Fetched email confirmation code for '{email}'")
+            logger.info("Fetched email confirmation code for '%s'", email)
             return code_str
         
         except (ValueError, UnicodeDecodeError):
-            logger.exception(f"Failed to decode email confirmation code for '{email}'")
+            logger.exception("Failed to decode email confirmation code for '%s'", email)
             return None
 
+    @timed("redis")
     async def delete_email_confirmation_code(self, email: str) -> None:
         key = self._get_key_email_confirmation_code(email)
 
         await self.client.delete(key)
-        logger.info(f"Deleted email confirmation code for '{email}'")
+        logger.info("Deleted email confirmation code for '%s'", email)
+
+# Marks the old refresh token used and issues the new one of the same family. Presenting a used token again means it leaked
+# KEYS[1] - old token, KEYS[2] - new token, KEYS[3] - revoked identifiers. ARGV[1] - new token TTL in seconds, ARGV[2] - now (unix seconds)
+ROTATE_REFRESH_TOKEN_SCRIPT = """
+local record = redis.call('HMGET', KEYS[1], 'username', 'family', 'used')
+if not record[1] then
+    return {0}
+end
 
-redis_attempt_limiter = RedisAttemptLimiter()
+local revoked_until = redis.call('ZSCORE', KEYS[3], record[2])
+if revoked_until and tonumber(revoked_until) > tonumber(ARGV[2]) then
+    return {0}
+end
+
+if record[3] == '1' then
+    return {-1, record[1], record[2]}
+end
+
+redis.call('HSET', KEYS[1], 'used', '1') -- Kept until its own TTL, so reuse can be detected
+redis.call('HSET', KEYS[2], 'username', record[1], 'family', record[2], 'used', '0')
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return {1, record[1], record[2]}
+"""
+
+class RedisRefreshToken(_RedisBase):
+    def bind(self, client: Redis) -> None:
+        super().bind(client)
+        self._rotate = client.register_script(ROTATE_REFRESH_TOKEN_SCRIPT)
+
+    def _get_key_refresh_token(self, token: str) -> str:
+        return f"refresh_token:{hashlib.sha256(token.encode()).hexdigest()}" # Only digests are stored. A Redis dump doesn't leak usable tokens
+
+    @timed("redis")
+    async def store_refresh_token(self, token: str, username: str, family: str, expires_days: int) -> None:
+        key = self._get_key_refresh_token(token)
+
+        async with self.client.pipeline(transaction=True) as pipe: # HSET + EXPIRE in one round trip, atomically
+            pipe.hset(key, mapping={"username": username, "family": family, "used": "0"})
+            pipe.expire(key, timedelta(days=expires_days))
+            await pipe.execute()
+        logger.info("Refresh token stored for user '%s'", username)
+
+    @timed("redis")
+    async def rotate_refresh_token(self, old_token: str, new_token: str, expires_days: int) -> tuple[str, str]:
+        result = await self._rotate(
+            keys=[
+                self._get_key_refresh_token(old_token), 
+                self._get_key_refresh_token(new_token), 
+                RedisTokenRevocation.REVOKED_KEY
+            ],
+            args=[int(timedelta(days=expires_days).total_seconds()), int(time.time())]
+        )
+
+        if result[0] == 0:
+            raise TokenNotFoundError("Refresh token expired, revoked or doesn't exist")
+        
+        username, family = result[1].decode(), result[2].decode()
+        if result[0] == -1:
+            raise RefreshTokenReuseError(username, family)
+        
+        logger.info("Refresh token rotated for user '%s'", username)
+        return username, family
+    
+    @timed("redis")
+    async def get_refresh_token_family(self, token: str) -> Optional[str]:
+        family: bytes = await self.client.hget(self._get_key_refresh_token(token), "family")
+        return family.decode() if family else None
+
+class RedisTokenRevocation(_RedisBase):
+    REVOKED_KEY = "revoked_tokens" # Sorted set: token id or family -> unix time after which the entry is useless
+    CHANNEL = "revoked_tokens"
+
+    @timed("redis")
+    async def revoke(self, identifier: str, expires_at: int) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.REVOKED_KEY, {identifier: expires_at})
+            pipe.zremrangebyscore(self.REVOKED_KEY, '-inf', int(time.time())) # Keeps the set from growing forever
+            pipe.publish(self.CHANNEL, f"{identifier} {expires_at}")
+            await pipe.execute()
+        logger.info("Revoked token id '%s' until %s", identifier, expires_at)
+
+    @timed("redis")
+    async def get_revoked(self) -> dict[str, float]:
+        revoked = await self.client.zrangebyscore(self.REVOKED_KEY, int(time.time()), '+inf', withscores=True)
+        return {identifier.decode(): expires_at for identifier, expires_at in revoked}
+
+class RedisRecentWrites(_RedisBase):
+    # Read-your-writes for replica routing: after a user's own write, their reads go to the primary until replicas have caught up
+    def __init__(self, window_seconds: int):
+        super().__init__()
+        self.window_seconds = window_seconds
+
+    @staticmethod
+    def _get_keys(username: Optional[str], email: Optional[str]) -> list[str]:
+        keys = []
+        if username:
+            keys.append(f"recent_write:user:{username.lower()}") # Reads match users case-insensitively, so do the marks
+        if email:
+            keys.append(f"recent_write:email:{email.lower()}")
+        return keys
+
+    @timed("redis")
+    async def mark(self, username: Optional[str] = None, email: Optional[str] = None) -> None:
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in self._get_keys(username, email):
+                pipe.setex(key, self.window_seconds, 1)
+            await pipe.execute()
+
+    @timed("redis")
+    async def is_recent(self, username: Optional[str] = None, email: Optional[str] = None) -> bool:
+        keys = self._get_keys(username, email)
+        return bool(keys) and await self.client.exists(*keys) > 0
+
+# KEYS[1] - filter. ARGV[1] - bits per value, then that many bit positions for each value.
+# 1 if some value may be in the filter (or there is no filter yet), 0 if every value is definitely absent
+EXISTENCE_FILTER_CHECK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 1
+end
+local hashes = tonumber(ARGV[1])
+for first = 2, #ARGV, hashes do
+    local all_set = true
+    for i = first, first + hashes - 1 do
+        if redis.call('GETBIT', KEYS[1], ARGV[i]) == 0 then
+            all_set = false
+            break
+        end
+    end
+    if all_set then
+        return 1
+    end
+end
+return 0
+"""
+
+# KEYS[1] - filter, KEYS[2] - filter being rebuilt. ARGV - bit positions.
+# Only sets bits in filters that exist: a filter created here would hold just this value and answer 'absent' for everyone else
+EXISTENCE_FILTER_ADD_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        for i = 1, #ARGV do
+            redis.call('SETBIT', key, ARGV[i], 1)
+        end
+    end
+end
+return 0
+"""
+
+class RedisExistenceFilter(_RedisBase):
+    # Bloom filter of taken usernames and emails, one bitmap shared by all workers. It can say 'maybe taken' for a free value,
+    # never 'free' for a taken one (as long as every insert is added). Values are lowercased: only more 'maybe's, never fewer
+    def __init__(self, capacity: int, error_rate: float):
+        super().__init__()
+        values = max(capacity, 1) * 2 # A username and an email per user
+        self.bits = math.ceil(-values * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.bits / values * math.log(2)))
+        self.key = f"users_filter:{self.bits}:{self.hashes}" # Other sizing -> other key, never reads bits laid out for different parameters
+        self.building_key = f"{self.key}:building"
+        self.lock_key = f"{self.key}:lock"
+
+    def bind(self, client: Redis) -> None:
+        super().bind(client)
+        self._check = client.register_script(EXISTENCE_FILTER_CHECK_SCRIPT)
+        self._add = client.register_script(EXISTENCE_FILTER_ADD_SCRIPT)
+
+    def _positions(self, kind: str, value: str) -> list[int]:
+        # Double hashing: k positions out of two 64-bit halves of one digest
+        digest = hashlib.blake2b(f"{kind}:{value.lower()}".encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def _value_positions(self, username: Optional[str], email: Optional[str]) -> list[int]:
+        positions = []
+        if username:
+            positions += self._positions('u', username)
+        if email:
+            positions += self._positions('e', email)
+        return positions
+
+    @timed("redis")
+    async def might_contain(self, username: Optional[str] = None, email: Optional[str] = None) -> bool:
+        positions = self._value_positions(username, email)
+        return bool(positions) and await self._check(keys=[self.key], args=[self.hashes, *positions]) == 1
+
+    @timed("redis")
+    async def add(self, users: list[tuple[str, str]]) -> None:
+        positions = [position for username, email in users for position in self._value_positions(username, email)]
+        if positions:
+            await self._add(keys=[self.key, self.building_key], args=positions)
+
+    async def acquire_build_lock(self, hold_seconds: int) -> bool:
+        # Held for the whole interval, not released after a build: other workers starting meanwhile don't rebuild again
+        return bool(await self.client.set(self.lock_key, uuid4().hex, nx=True, ex=hold_seconds))
+
+    async def release_build_lock(self) -> None:
+        await self.client.delete(self.lock_key)
+
+    async def begin_build(self, expires_seconds: int) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(self.building_key) # Left over from a build that died. Otherwise it expires on its own
+            pipe.setbit(self.building_key, self.bits - 1, 0) # Allocates the bitmap. From now on add() writes to it too
+            pipe.expire(self.building_key, expires_seconds)
+            await pipe.execute()
+
+    async def add_to_build(self, users: list[tuple[str, str]]) -> None:
+        bitfield = self.client.bitfield(self.building_key)
+        for username, email in users:
+            for position in self._value_positions(username, email):
+                bitfield.set('u1', position, 1)
+        await bitfield.execute() # One command per chunk of users
+
+    async def finish_build(self) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rename(self.building_key, self.key) # Atomic swap. Checks never see a half-built filter
+            pipe.persist(self.key)
+            await pipe.execute()
+
+# KEYS[1] - cached credentials, KEYS[2] - their generation. Returns {generation, user id, hash}, id and hash nil on a miss
+CREDENTIAL_CACHE_GET_SCRIPT = """
+local generation = redis.call('GET', KEYS[2]) or '0'
+local entry = redis.call('HMGET', KEYS[1], 'id', 'hash')
+return {generation, entry[1], entry[2]}
+"""
+
+# KEYS as above. ARGV: generation read before loading from the DB, user id, hash, ttl.
+# An invalidation in between bumped the generation -> the loaded value may be old, don't store it
+CREDENTIAL_CACHE_FILL_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'id', ARGV[2], 'hash', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+class RedisCredentialCache(_RedisBase):
+    # Shared tier of the login credential cache. Unknown users are stored with an empty id and hash
+    CHANNEL = "credential_invalidations"
+    GENERATION_TTL_SECONDS = 86400 # Only has to outlive a DB read that started before the invalidation
+
+    def __init__(self, ttl_seconds: int):
+        super().__init__()
+        self.ttl_seconds = ttl_seconds
+
+    def bind(self, client: Redis) -> None:
+        super().bind(client)
+        self._get = client.register_script(CREDENTIAL_CACHE_GET_SCRIPT)
+        self._fill = client.register_script(CREDENTIAL_CACHE_FILL_SCRIPT)
+
+    @staticmethod
+    def _get_keys(username: str) -> list[str]:
+        return [f"cred:{username}", f"cred:{username}:generation"]
+
+    @timed("redis")
+    async def get(self, username: str) -> tuple[bytes, Optional[CachedCredentials]]:
+        generation, user_id, password_hashed = await self._get(keys=self._get_keys(username))
+        if password_hashed is None:
+            return generation, None
+        if not password_hashed:
+            return generation, CachedCredentials(None, None)
+        return generation, CachedCredentials(int(user_id), password_hashed.decode())
+
+    @timed("redis")
+    async def fill(self, username: str, generation: bytes, credentials: CachedCredentials) -> None:
+        await self._fill(
+            keys=self._get_keys(username),
+            args=[generation, credentials.user_id or '', credentials.password_hashed or '', self.ttl_seconds]
+        )
+
+    @timed("redis")
+    async def invalidate(self, usernames: list[str]) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            for username in usernames:
+                key, generation_key = self._get_keys(username)
+                pipe.delete(key)
+                pipe.incr(generation_key)
+                pipe.expire(generation_key, self.GENERATION_TTL_SECONDS)
+            pipe.publish(self.CHANNEL, json.dumps(usernames)) # One message per call, also for a bulk import batch
+            await pipe.execute()
+
+# Moves retries whose backoff has passed from the delayed set back to the stream. KEYS[1] - delayed set, KEYS[2] - stream. ARGV[1] - now
+PROMOTE_DUE_EMAILS_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, job in ipairs(due) do
+    redis.call('XADD', KEYS[2], '*', 'job', job)
+    redis.call('ZREM', KEYS[1], job)
+end
+return #due
+"""
+
+class RedisEmailQueue(_RedisBase):
+    # Stream + consumer group: a job stays pending until a worker acks it, so nothing is lost if a worker dies mid-send.
+    # Jobs carry codes/reset tokens: every ack deletes the entry (XDEL), so they don't outlive the send in the stream
+    STREAM = "email_queue"
+    GROUP = "email_workers"
+    DELAYED = "email_queue:delayed" # Sorted set: job -> unix time when it may be retried
+    DEAD = "email_queue:dead" # Jobs that ran out of retries. Kept for inspection, without their code/token
+
+    def bind(self, client: Redis) -> None:
+        super().bind(client)
+        self._promote_due = client.register_script(PROMOTE_DUE_EMAILS_SCRIPT)
+
+    async def ensure_group(self) -> None:
+        try:
+            await self.client.xgroup_create(self.STREAM, self.GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e): # Group already created by another worker
+                raise
+
+    @timed("email") # Reported as email enqueue, not as generic redis time
+    async def enqueue(self, job: EmailJob) -> None:
+        await self.client.xadd(self.STREAM, {"job": job.model_dump_json()})
+        logger.info("Email '%s' queued for %s", job.kind, job.email)
+
+    async def read_batch(self, consumer: str, count: int, block_ms: int) -> list[tuple[bytes, EmailJob]]: # Not timed: blocks on purpose while the queue is empty
+        response = await self.client.xreadgroup(self.GROUP, consumer, {self.STREAM: '>'}, count=count, block=block_ms)
+        if not response:
+            return []
+        _, entries = response[0]
+        return [(entry_id, EmailJob.model_validate_json(fields[b"job"])) for entry_id, fields in entries]
+
+    @timed("redis")
+    async def claim_stale(self, consumer: str, min_idle_ms: int, count: int) -> list[tuple[bytes, EmailJob]]:
+        # Takes over jobs read by a worker that died before acking them
+        _, entries, *_ = await self.client.xautoclaim(self.STREAM, self.GROUP, consumer, min_idle_ms, start_id='0', count=count)
+        return [(entry_id, EmailJob.model_validate_json(fields[b"job"])) for entry_id, fields in entries if fields]
+
+    @timed("redis")
+    async def ack(self, entry_ids: list[bytes]) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.xack(self.STREAM, self.GROUP, *entry_ids)
+            pipe.xdel(self.STREAM, *entry_ids)
+            await pipe.execute()
+
+    @timed("redis")
+    async def retry_later(self, entry_id: bytes, job: EmailJob, delay_seconds: float) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.DELAYED, {job.model_dump_json(): time.time() + delay_seconds})
+            pipe.xack(self.STREAM, self.GROUP, entry_id)
+            pipe.xdel(self.STREAM, entry_id)
+            await pipe.execute()
+
+    @timed("redis")
+    async def dead_letter(self, entry_id: bytes, job: EmailJob) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            # The code or reset token stays valid until it expires. Anyone reading Redis could use it, and it's never sent again
+            pipe.xadd(self.DEAD, {"job": job.model_dump_json(exclude={"payload"})}, maxlen=10000, approximate=True)
+            pipe.xack(self.STREAM, self.GROUP, entry_id)
+            pipe.xdel(self.STREAM, entry_id)
+            await pipe.execute()
+        logger.error("Email '%s' to %s dropped after %s attempts", job.kind, job.email, job.attempt)
+
+    @timed("redis")
+    async def promote_due(self) -> int:
+        return await self._promote_due(keys=[self.DELAYED, self.STREAM], args=[time.time()])
+
+redis_attempt_limiter = RedisAttemptLimiter(
+    max_attempts=settings.LOGIN_MAX_ATTEMPTS,
+    window_seconds=settings.LOGIN_ATTEMPT_WINDOW_SECONDS
+)
 redis_password_reset_token = RedisPasswordResetToken()
-redis_user_for_signup = RedisUserForSignup()
-redis_email_code = RedisEmailCode()
\ No newline at end of file
+redis_user_for_signup = RedisUserForSignup(SignupRecordSerializer(settings.SIGNUP_RECORD_FORMAT))
+redis_email_code = RedisEmailCode()
+redis_refresh_token = RedisRefreshToken()
+redis_token_revocation = RedisTokenRevocation()
+redis_email_queue = RedisEmailQueue()
+redis_recent_writes = RedisRecentWrites(window_seconds=settings.DB_READ_YOUR_WRITES_SECONDS)
+redis_credential_cache = RedisCredentialCache(ttl_seconds=settings.CREDENTIAL_CACHE_REDIS_TTL_SECONDS)
+redis_existence_filter = RedisExistenceFilter(
+    capacity=settings.EXISTENCE_FILTER_CAPACITY,
+    error_rate=settings.EXISTENCE_FILTER_ERROR_RATE
+)
+
+def bind_redis_services(client: Redis) -> None:
+    for service in (
+        redis_attempt_limiter,
+        redis_password_reset_token,
+        redis_user_for_signup,
+        redis_email_code,
+        redis_refresh_token,
+        redis_token_revocation,
+        redis_email_queue,
+        redis_recent_writes,
+        redis_credential_cache,
+        redis_existence_filter
+    ):
+        service.bind(client)
+    logger.info("Redis services bound to shared connection pool")
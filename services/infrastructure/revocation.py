@@ -0,0 +1,75 @@
+import asyncio, time
+from logger.logger import logger
+
+from typing import Optional
+
+from services.infrastructure.redis import redis_token_revocation, RedisTokenRevocation
+
+class RevocationFilter:
+    # In-process mirror of the revoked ids in Redis. decode_token checks it on every request without a network round trip.
+    # Kept current by pub/sub. On (re)connect we subscribe first and load the full set second, so nothing published in between is lost
+    PRUNE_INTERVAL = 60 # seconds
+
+    def __init__(self):
+        self._revoked: dict[str, float] = {} # id -> unix time after which the entry can be dropped
+        self._task: Optional[asyncio.Task] = None
+        self._last_prune = time.time()
+
+    def is_revoked(self, *identifiers: Optional[str]) -> bool:
+        now = time.time()
+        revoked = self._revoked # Read from threadpool while the loop may swap it. A single reference read is atomic
+        for identifier in identifiers:
+            expires_at = revoked.get(identifier) if identifier else None
+            if expires_at is not None and expires_at > now:
+                return True
+        return False
+
+    def add(self, identifier: str, expires_at: float) -> None:
+        self._revoked[identifier] = expires_at
+
+    def _prune(self) -> None:
+        now = time.time()
+        self._revoked = {identifier: expires_at for identifier, expires_at in self._revoked.items() if expires_at > now}
+        self._last_prune = now
+
+    async def _sync(self) -> None:
+        while True:
+            pubsub = redis_token_revocation.client.pubsub()
+            try:
+                await pubsub.subscribe(RedisTokenRevocation.CHANNEL)
+                self._revoked.update(await redis_token_revocation.get_revoked())
+                logger.info("Revocation filter synced: %s revoked ids", len(self._revoked))
+
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0) # Timeout keeps the loop under socket_timeout and lets us prune
+                    if message is not None:
+                        identifier, expires_at = message["data"].decode().split(' ')
+                        self.add(identifier, float(expires_at))
+
+                    if time.time() - self._last_prune > self.PRUNE_INTERVAL:
+                        self._prune()
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception:
+                logger.exception("Revocation filter lost connection to Redis, resyncing")
+                await asyncio.sleep(1)
+
+            finally:
+                await pubsub.aclose()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._sync())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+revocation_filter = RevocationFilter()
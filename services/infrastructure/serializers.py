@@ -0,0 +1,46 @@
+import json
+from typing import Literal
+
+from schemas.user import CredentialsHashed
+
+SignupRecordFormat = Literal['json', 'compact', 'msgpack']
+
+class SignupRecordSerializer:
+    # Pending signups are written by us, right after Credentials validation -> reading them back doesn't need validation again.
+    # 'json'    - legacy {"username": ..., "hashed_password": ..., "email": ...}
+    # 'compact' - JSON array [username, hashed_password, email]. No field names, no extra dependency
+    # 'msgpack' - msgpack array of the same three fields. Smallest and fastest, needs 'msgpack' installed
+    def __init__(self, record_format: SignupRecordFormat = 'compact'):
+        self.record_format = record_format
+        if record_format == 'msgpack':
+            import msgpack # Optional dependency. Imported only if configured, fails at startup instead of first signup
+            self._msgpack = msgpack
+        else:
+            self._msgpack = None
+
+    def dumps(self, user_info: CredentialsHashed) -> bytes:
+        fields = (user_info.username, user_info.hashed_password, user_info.email)
+
+        if self.record_format == 'msgpack':
+            return self._msgpack.packb(fields)
+        if self.record_format == 'compact':
+            return json.dumps(fields, separators=(',', ':')).encode()
+        return json.dumps(user_info.model_dump()).encode()
+
+    def loads(self, user_info_bytes: bytes) -> CredentialsHashed:
+        # Format is detected from the first byte, not from settings. Records written before a format switch still decode during rollout
+        first_byte = user_info_bytes[:1]
+
+        if first_byte == b'{':
+            user_info_dict: dict = json.loads(user_info_bytes)
+            return CredentialsHashed.from_trusted(**user_info_dict)
+        
+        if first_byte == b'[':
+            username, hashed_password, email = json.loads(user_info_bytes)
+        else:
+            if self._msgpack is None:
+                import msgpack
+                self._msgpack = msgpack
+            username, hashed_password, email = self._msgpack.unpackb(user_info_bytes)
+
+        return CredentialsHashed.from_trusted(username, hashed_password, email)
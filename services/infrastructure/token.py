@@ -1,38 +1,93 @@
 from logger.logger import logger
 
+import secrets
+from uuid import uuid4
+
 from jose import jwt, JWTError
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 from configs.app_settings import settings
 
-from services.infrastructure.redis import redis_password_reset_token
+from security.jwt_keys import jwt_key_ring
+
+from metrics.metrics import timed
+
+from services.infrastructure.redis import (
+    redis_password_reset_token,
+    redis_refresh_token,
+    redis_token_revocation
+)
+from services.infrastructure.revocation import revocation_filter
 
-from schemas.exceptions import InvalidTokenError, TokenNotFoundError, TokenCreationError
+from schemas.exceptions import InvalidTokenError, TokenNotFoundError, TokenCreationError, RefreshTokenReuseError
 
 class TokenService:
-    def create_access_token(self, username: str, expires_minutes: int) -> str:
+    @timed("jwt")
+    def create_access_token(self, username: str, expires_minutes: int, family: Optional[str] = None) -> str:
         expires_at = datetime.now(timezone.utc) + timedelta(minutes=expires_minutes)
         to_encode = {
             "sub": username,
             "exp": expires_at,
+            "jti": uuid4().hex, # Lets a single token be revoked
         }
+        if family:
+            to_encode["fid"] = family # Refresh token family. Revoking it kills every access token issued from that login
 
         try:
-            token = jwt.encode(to_encode, settings.JWT_SECRET, settings.ALGORITHM)
+            kid, key = jwt_key_ring.signing_key()
+            token = jwt.encode(
+                to_encode, 
+                key, 
+                jwt_key_ring.algorithm, 
+                headers={"kid": kid} if kid else None # 'kid' tells verifiers which published key to use
+            )
             return token
         
         except JWTError as e:
-            logger.exception(f"Failed to create JWT token for user {username}")
+            logger.exception("Failed to create JWT token for user %s", username)
             raise TokenCreationError from e     
     
     async def validate_password_reset_token_from_redis(self, username: str, token_to_validate: str):
         stored_token = await redis_password_reset_token.get_password_reset_token(username)
         if stored_token is None:
-            logger.info(f"No password reset token found for user '{username}'")
+            logger.info("No password reset token found for user '%s'", username)
             raise TokenNotFoundError("Token expired or doesn't exist")
         
         if token_to_validate != stored_token:
-            logger.info(f"Password reset token for user '{username} doesn't match provided token'")
+            logger.info("Password reset token for user '%s doesn't match provided token'", username)
             raise InvalidTokenError("Invalid token")
 
+    async def create_refresh_token(self, username: str, family: str) -> str:
+        refresh_token = secrets.token_urlsafe(32) # Opaque, not a JWT. It is only ever checked against Redis
+        await redis_refresh_token.store_refresh_token(refresh_token, username, family, settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        return refresh_token
+
+    async def rotate_refresh_token(self, refresh_token: str) -> tuple[str, str, str]:
+        new_refresh_token = secrets.token_urlsafe(32)
+        try:
+            username, family = await redis_refresh_token.rotate_refresh_token(
+                refresh_token, 
+                new_refresh_token, 
+                settings.REFRESH_TOKEN_EXPIRE_DAYS
+            )
+            return new_refresh_token, username, family
+        
+        except RefreshTokenReuseError as e:
+            username, family = e.args
+            logger.warning("Refresh token reuse detected for user '%s', revoking token family", username) # Either client or attacker holds a stolen token
+            await self.revoke_family(family)
+            raise InvalidTokenError("Refresh token reuse detected") from e
+
+    async def revoke_family(self, family: str) -> None:
+        expires_at = int((datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)).timestamp())
+        revocation_filter.add(family, expires_at) # Effective in this worker right away, others get it via pub/sub
+        await redis_token_revocation.revoke(family, expires_at)
+
+    async def revoke_refresh_token(self, refresh_token: str) -> None:
+        family = await redis_refresh_token.get_refresh_token_family(refresh_token)
+        if family is None:
+            raise TokenNotFoundError("Refresh token expired or doesn't exist")
+        await self.revoke_family(family)
+
 token_service = TokenService()
\ No newline at end of file
@@ -1,39 +1,44 @@
-import asyncio
 from logger.logger import logger
 
-from typing import Callable
+from typing import Optional
 
 from fastapi import HTTPException, status
-from sqlalchemy.ext.asyncio import AsyncSession
+
+from configs.app_settings import settings
 
 from dependencies.token import decode_token
 
 from utils.email_code import CodeGenerator
 from services.infrastructure.db import DbService
-from services.infrastructure.email import email_service
 from services.infrastructure.token import token_service
 from services.infrastructure.redis import (
     redis_password_reset_token,
-    redis_email_code
+    redis_email_code,
+    redis_email_queue
 )
 
 from schemas.user import PasswordResetRequest
+from schemas.email import EmailJob
 from schemas.token import TokenResponse, TokenSub
-from schemas.exceptions import DatabaseError, TokenNotFoundError, InvalidTokenError, EmailSendError
+from schemas.exceptions import (
+    DatabaseError, 
+    TokenNotFoundError, 
+    InvalidTokenError, 
+    EmailSendError, 
+    HashingPoolSaturatedError
+)
+
+from metrics.metrics import email_sends_avoided_total
 
 class ResetConfirmService:
-    def __init__(self, db: AsyncSession):
-        self.db_service = DbService(db) # If db init fails, this will raise
+    def __init__(self, db_service: DbService):
+        self.db_service = db_service
 
-    async def _request_email(
-        self, 
-        user_email: str, 
-        func: Callable[[str], None], # Callable [[arguments type], return type]
-        *args: str
-    ) -> None: 
-        
-        loop = asyncio.get_running_loop() # sending email is sync. executor runs blocking (synchronous) code in a separate thread without blocking async
-        await loop.run_in_executor(None, func, user_email, *args) # user_email and *args are arguments passed to func
+    async def _request_email(self, job: EmailJob) -> None:
+        try:
+            await redis_email_queue.enqueue(job) # Only enqueue. SMTP happens in EmailQueueWorker, outside of the request
+        except Exception as e:
+            raise EmailSendError("Failed to queue email") from e
             
     async def request_password_reset(
         self, 
@@ -43,18 +48,26 @@ class ResetConfirmService:
         try:
             users = await self.db_service.get_user_by_username_or_email(email=user_email)
             if len(users) == 0:
-                logger.info(f"Unknown email: password reset request rejected for mail: {user_email}")
+                logger.info("Unknown email: password reset request rejected for mail: %s", user_email)
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Invalid email address"
                 )
             
-            user = users[0] # users is a list of one
+            user = users[0] # The only row: lower(email) is unique (migration 0003), so 'Bob@x.com' can't match a second user
             username = user.username
-            token = token_service.create_access_token(username, expires_minutes=30)
+            if not await redis_password_reset_token.claim_password_reset_send(username, settings.EMAIL_COOLDOWN_SECONDS):
+                email_sends_avoided_total.labels('password_reset').inc()
+                logger.info("Password reset email for '%s' already sent within %s s, not sending another", username, settings.EMAIL_COOLDOWN_SECONDS)
+                return # The link already sent is still valid
 
-            await redis_password_reset_token.store_password_reset_token(username, token, expires_minutes=30)
-            await self._request_email(user_email, email_service.send_password_reset_email, username, token)
+            try:
+                token = token_service.create_access_token(username, expires_minutes=30)
+                await redis_password_reset_token.store_password_reset_token(username, token, expires_minutes=30)
+                await self._request_email(EmailJob(kind='password_reset', email=user_email, username=username, payload=token))
+            except Exception:
+                await redis_password_reset_token.release_password_reset_cooldown(username)
+                raise
         
         except (DatabaseError, EmailSendError):
             logger.exception("Unexpected error while requesting password reset email")
@@ -63,23 +76,44 @@ class ResetConfirmService:
                 detail="Unexpected error while requesting password reset email"
             )
     
-    async def request_email_confirm(
-        self, 
-        user_email: str,
-        username: str
-    ) -> None:
-        
+    async def claim_email_confirm(self, user_email: str) -> Optional[str]:
+        # Code to send to the address, or None if one was sent within the cooldown (the code sent then is still pending).
+        # Call release_email_confirm() if the send doesn't happen
+        code = await redis_email_code.claim_email_confirmation_code(
+            user_email,
+            CodeGenerator.generate_code(length=6),
+            expires_minutes=30,
+            cooldown_seconds=settings.EMAIL_COOLDOWN_SECONDS
+        )
+        if code is None:
+            email_sends_avoided_total.labels('email_confirm').inc()
+            logger.info("Confirmation email to '%s' already sent within %s s, not sending another", user_email, settings.EMAIL_COOLDOWN_SECONDS)
+        return code
+
+    async def release_email_confirm(self, user_email: str) -> None:
+        await redis_email_code.release_email_confirmation_cooldown(user_email)
+
+    async def send_email_confirm(self, user_email: str, username: str, code: str) -> None:
         try:
-            code = CodeGenerator.generate_code(length=6)
-            await self._request_email(user_email, email_service.send_email_confirm, username, code)
-            await redis_email_code.store_email_confirmation_code(code, user_email, 30)
+            await self._request_email(EmailJob(kind='email_confirm', email=user_email, username=username, payload=code))
 
         except EmailSendError:
             logger.exception("Unexpected error while requesting email confirmation")
+            await self.release_email_confirm(user_email)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Unexpected error while requesting email confirmation"
             )
+
+    async def request_email_confirm(
+        self, 
+        user_email: str,
+        username: str
+    ) -> None:
+        
+        code = await self.claim_email_confirm(user_email)
+        if code is not None:
+            await self.send_email_confirm(user_email, username, code)
         
     async def reset_password(
         self, 
@@ -112,4 +146,10 @@ class ResetConfirmService:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Unexpected error during password reset"
+            )
+        
+        except HashingPoolSaturatedError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later"
             )
\ No newline at end of file
@@ -0,0 +1,19 @@
+import pytest
+
+from benchmarks.cold_start import BUDGET_MS, measure, side_effect_failures
+
+# 'import app' in fresh interpreters, as benchmarks/cold_start.py does. Needs the app's settings in the environment,
+# like any 'import app'. Nothing is connected to: the test fails if importing tries to
+
+@pytest.fixture(scope="module")
+def cold_start():
+    return measure(runs=3)
+
+def test_import_is_within_budget(cold_start):
+    median_ms, _ = cold_start
+    assert median_ms <= BUDGET_MS, f"'import app' took {median_ms:.0f} ms (median), budget is {BUDGET_MS} ms"
+
+def test_import_has_no_side_effects(cold_start):
+    _, samples = cold_start
+    for _, side_effects in samples:
+        assert side_effect_failures(side_effects) == []